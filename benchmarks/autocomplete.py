@@ -0,0 +1,56 @@
+# replays typing color names one keystroke at a time through the /color
+# autocomplete index and compares it to a linear scan over every name
+# run from the repository root: python -m benchmarks.autocomplete
+import random
+import time
+
+import utils
+
+BUDGET_MS = 1.0  # per keystroke lookup, leaves the 3 s window to the network
+
+
+def linear_complete(keys: list[str], prefix: str, limit: int = 25) -> list[int]:
+    prefix = prefix.lower().strip()
+    starts = [i for i, key in enumerate(keys) if key.startswith(prefix)]
+    words = [i for i, key in enumerate(keys) if f" {prefix}" in key]
+    return (starts + words)[:limit]
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main(names_typed: int = 200, seed: int = 69):
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    index = utils.get_name_index()
+    print(f"index build: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    keystrokes = []
+    for name in rng.sample(list(utils.get_palette().names), names_typed):
+        keystrokes.extend(name[:i] for i in range(1, len(name) + 1))
+
+    indexed = []
+    for prefix in keystrokes:
+        start = time.perf_counter()
+        index.complete(prefix)
+        indexed.append((time.perf_counter() - start) * 1000)
+
+    linear = []
+    for prefix in keystrokes[:: max(1, len(keystrokes) // 200)]:
+        start = time.perf_counter()
+        linear_complete(index.keys, prefix)
+        linear.append((time.perf_counter() - start) * 1000)
+
+    over = sum(1 for ms in indexed if ms > BUDGET_MS)
+    print(f"keystrokes: {len(keystrokes)}, over {BUDGET_MS} ms budget: {over}")
+    for label, samples in (("prefix index", indexed), ("linear scan", linear)):
+        print(
+            f"{label:>12}: p50 {percentile(samples, 0.5):.3f} ms, "
+            f"p99 {percentile(samples, 0.99):.3f} ms, max {max(samples):.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
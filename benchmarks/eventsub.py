@@ -0,0 +1,91 @@
+# drives the eventsub client against a local stand-in for twitch's eventsub
+# websocket: subscribing, go-live latency, a server requested reconnect and a
+# dead connection, with helix subscription requests answered in memory
+# run from the repository root: python -m benchmarks.eventsub
+import json
+import time
+
+import httpx
+import trio
+from trio_websocket import serve_websocket
+
+import utils
+from tests.eventsub_server import COST_LIMIT, StandInEventSub
+
+STREAMS = 8
+
+
+async def main():
+    server = StandInEventSub()
+    received: dict[str, float] = {}
+    arrived = trio.Event()
+
+    async def on_online(user_id: str, login: str):
+        received[user_id] = time.perf_counter()
+        if len(received) == COST_LIMIT:
+            arrived.set()
+
+    async def on_offline(user_id: str, login: str):
+        pass
+
+    twitch = utils.TwitchClient("client id", utils.TokenManager("client id", path=None))
+    twitch.http = httpx.AsyncClient(transport=httpx.MockTransport(server.helix))
+    user_ids = {str(i) for i in range(STREAMS)}
+
+    async with trio.open_nursery() as nursery:
+        listener = await nursery.start(
+            serve_websocket, server.handler, "127.0.0.1", 0, None
+        )
+        server.port = listener.port
+        client = utils.EventSubClient(
+            twitch,
+            "user token",
+            on_online,
+            on_offline,
+            f"ws://127.0.0.1:{server.port}/ws",
+        )
+        client.KEEPALIVE_GRACE = 0.5
+        nursery.start_soon(client.run, lambda: user_ids)
+
+        start = time.perf_counter()
+        while not client.subscribed:
+            await trio.sleep(0.01)
+        print(
+            f"subscribed {len(client.subscribed)}/{STREAMS} streams "
+            f"({len(client.refused)} left to polling) in "
+            f"{(time.perf_counter() - start) * 1000:.1f} ms, covers all: "
+            f"{client.covers(user_ids)}"
+        )
+
+        sent = time.perf_counter()
+        for user_id in sorted(client.subscribed):
+            await server.notify(user_id, "stream.online")
+        await arrived.wait()
+        latencies = sorted((at - sent) * 1000 for at in received.values())
+        print(f"go-live pushes: {len(latencies)}, max latency {latencies[-1]:.2f} ms")
+
+        before = server.subscription_requests
+        await server.reconnect()
+        while client.reconnects == 0 or not client.connected:
+            await trio.sleep(0.01)
+        added = server.subscription_requests - before
+        print(
+            f"server reconnect: subscriptions kept {len(server.subscribed)}, "
+            f"new subscription requests {added}"
+        )
+
+        server.silent = True
+        start = time.perf_counter()
+        while client.connected:
+            await trio.sleep(0.01)
+        print(f"dead connection noticed after {time.perf_counter() - start:.2f} s")
+        server.silent = False
+        while not client.connected or not client.subscribed:
+            await trio.sleep(0.01)
+        print(f"resubscribed {len(client.subscribed)} streams on a new session")
+        print(f"client stats: {json.dumps(client.stats())}")
+        nursery.cancel_scope.cancel()
+
+
+if __name__ == "__main__":
+    trio.run(main)
@@ -0,0 +1,74 @@
+# compares utils.NameIndex against the old difflib scan over every color name
+# run from the repository root: python -m benchmarks.namesearch
+import difflib
+import random
+import time
+
+import utils
+
+
+def difflib_scan(names: list[str], name: str) -> int:
+    # the lookup /color used before the name index
+    best = 0
+    bestindex = 0
+    for index, color_name in enumerate(names):
+        ratio = difflib.SequenceMatcher(None, name.lower(), color_name.lower()).ratio()
+        if ratio > best:
+            bestindex = index
+            best = ratio
+    return bestindex
+
+
+def misspell(name: str, rng: random.Random) -> str:
+    chars = list(name.lower())
+    for _ in range(rng.randint(1, 2)):
+        i = rng.randrange(len(chars))
+        op = rng.choice(("drop", "swap", "replace", "insert"))
+        if op == "drop" and len(chars) > 3:
+            del chars[i]
+        elif op == "swap" and i + 1 < len(chars):
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+        elif op == "replace":
+            chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        else:
+            chars.insert(i, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    return "".join(chars)
+
+
+def main(queries: int = 40, seed: int = 69):
+    rng = random.Random(seed)
+    names = list(utils.get_palette().names)
+    start = time.perf_counter()
+    index = utils.get_name_index()
+    print(f"index build: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    samples = [misspell(rng.choice(names), rng) for _ in range(queries)]
+    samples += ["blu", "reddish", "sea foam", "dark purple", "grass"]
+
+    same = 0
+    scan_time = 0.0
+    index_time = 0.0
+    for query in samples:
+        start = time.perf_counter()
+        expected = difflib_scan(names, query)
+        scan_time += time.perf_counter() - start
+        start = time.perf_counter()
+        found, _ = index.search(query)
+        index_time += time.perf_counter() - start
+        if found == expected:
+            same += 1
+        else:
+            old = difflib.SequenceMatcher(None, query, names[expected].lower()).ratio()
+            new = difflib.SequenceMatcher(None, query, names[found].lower()).ratio()
+            print(
+                f"{query!r}: scan={names[expected]!r} ({old:.3f}) "
+                f"index={names[found]!r} ({new:.3f})"
+            )
+
+    print(f"queries: {len(samples)}, same result: {same}")
+    print(f"difflib scan: {scan_time / len(samples) * 1000:.2f} ms/query")
+    print(f"name index:   {index_time / len(samples) * 1000:.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,17 +4,11 @@ import os
 import trio
 import sqlite3
 import random
+import time
 import numpy
-import cv2
 import json
 import httpx
-import difflib
-from PIL import Image, ImageDraw
-from streamlink.session import Streamlink
-from streamlink.options import Options
-from colormath.color_conversions import convert_color
-from colormath.color_diff import delta_e_cie1976, delta_e_cie2000
-from colormath.color_objects import LabColor, sRGBColor
+from colormath.color_objects import sRGBColor
 from collections import defaultdict
 from typing import Any
 from dotenv import load_dotenv
@@ -47,14 +41,15 @@ logging.getLogger("colormath").setLevel(logging.WARNING)
 
 
 class Mumbot(discord.Client):
+    METRICS_INTERVAL = 600
+    PUSH_GRACE = 180  # seconds a poll can't undo an eventsub push, helix lags behind
+    ANNOUNCE_DEADLINE = 2  # seconds a go-live announcement waits for its thumbnail
+
     def __init__(self):
         load_dotenv("./appdata/.env", override=True)
         self.owner_id = os.environ.get("OWNER_ID")
         BOT_TOKEN = os.environ.get("BOT_TOKEN")
-        TWITCH_TOKEN = utils.get_twitch_bearer_token()
         assert isinstance(BOT_TOKEN, str)
-        assert isinstance(TWITCH_TOKEN, str)
-        os.environ["TWITCH_TOKEN"] = TWITCH_TOKEN
         log.info("Token found. Initializing mumbot v1.12...")
         super().__init__(BOT_TOKEN)
 
@@ -63,8 +58,43 @@ class Mumbot(discord.Client):
         streams = utils.get_all_streams(self.con)
         for stream in streams:
             self.user_streams[stream[0]].append(stream[1])
-        self.color_list: list[sRGBColor] = []
+        self.rainbow = utils.RainbowScheduler(
+            self.update_role, on_gradient=utils.warm_color_names
+        )
         self.commands = {}
+        self.capture = utils.CaptureService()
+        thumbnail_ttl = float(
+            os.environ.get("THUMBNAIL_TTL") or utils.SnapshotCache.TTL
+        )
+        self.snapshots = utils.SnapshotCache(self.capture, thumbnail_ttl)
+        self.animations = utils.AnimationMaker(self.capture)
+        self.resolver = utils.UserIdResolver(self.con)
+        self.poller = utils.PollScheduler(utils.get_twitch_client().rate_limit)
+        self.announcements: None | trio.Nursery = None
+        # user id -> time.monotonic() of the last eventsub push, not trio's
+        # clock, which starts over on every gateway reconnect
+        self.pushed_at: dict[str, float] = {}
+        self.eventsub: None | utils.EventSubClient = None
+        EVENTSUB_TOKEN = os.environ.get("TWITCH_EVENTSUB_TOKEN")
+        if EVENTSUB_TOKEN:
+            self.eventsub = utils.EventSubClient(
+                utils.get_twitch_client(),
+                EVENTSUB_TOKEN,
+                self.stream_online,
+                self.stream_offline,
+                os.environ.get("TWITCH_EVENTSUB_URL") or utils.EVENTSUB_URL,
+            )
+            self.eventsub.on_disconnect = self.poller.wake
+        # "twitch" tries twitch's own preview image before capturing the stream
+        self.thumbnail_mode = os.environ.get("THUMBNAIL_MODE") or "capture"
+        width, height = (os.environ.get("THUMBNAIL_SIZE") or "320x180").split("x")
+        self.thumbnail_size = (int(width), int(height))
+        self.thumbnail_profile = utils.ImageProfile(self.thumbnail_size, quality=80)
+        self.streampic_profile = utils.ImageProfile(
+            (1920, 1080),
+            format=os.environ.get("STREAMPIC_FORMAT") or "JPEG",
+            max_bytes=int(os.environ.get("STREAMPIC_MAX_BYTES") or 1500000),
+        )
 
     def initialize_database(self) -> sqlite3.Connection:
         sqlite3.register_adapter(utils.Stream, utils.adapt_stream)
@@ -74,6 +104,7 @@ class Mumbot(discord.Client):
         utils.create_users_table(con)
         utils.create_userstreams_table(con)
         utils.create_guilds_table(con)
+        utils.create_twitchusers_table(con)
         return con
 
     async def register_slash_commands(self, guild_id: str):
@@ -106,6 +137,18 @@ class Mumbot(discord.Client):
         )
         log.info(f"Set permissions for {command_name} command.")
 
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        return {
+            "swatch_cache": utils.swatch_cache.stats(),
+            "color_name_cache": utils.color_name_cache.stats(),
+            "thumbnail_cache": self.snapshots.stats(),
+            "stream_resolve_cache": self.capture.sessions.stats(),
+            "twitch_polling": self.poller.stats(),
+            "eventsub": self.eventsub.stats() if self.eventsub else {},
+            "twitch_token": utils.get_twitch_client().tokens.stats(),
+            "twitch_user_ids": self.resolver.stats(),
+        }
+
     def get_guild_streams(self, guild_id: str) -> list[utils.Stream]:
         streams = []
         for user in self.user_streams.keys():
@@ -113,6 +156,61 @@ class Mumbot(discord.Client):
                 streams.extend(bot.user_streams[user])
         return streams
 
+    async def revalidate_streams(self):
+        # fills in user ids missing from stored twitch streams and picks up
+        # renames of the rest, a batch of 100 streams per request
+        streams = [
+            stream
+            for streams in self.user_streams.values()
+            for stream in streams
+            if stream.service == "twitch.tv"
+        ]
+        missing = [stream for stream in streams if not stream.userid]
+        if missing:
+            userids = await self.resolver.resolve_many([s.username for s in missing])
+            for stream in missing:
+                userid = userids.get(stream.username)
+                if not userid:
+                    continue
+                old = utils.Stream(stream.url, stream.service, stream.username, "")
+                stream.userid = userid
+                utils.update_stream(self.con, old, stream)
+            log.info(f"Revalidated {len(missing)} streams without user ids.")
+        user_ids = sorted({stream.userid for stream in streams if stream.userid})
+        try:
+            users = await utils.get_twitch_client().get_users(user_ids=user_ids)
+        except utils.TwitchError as e:
+            log.info(f"Couldn't check linked streams for renames! {e}")
+            return
+        logins = {user["id"]: user["login"] for user in users}
+        for stream in streams:
+            self.track_rename(stream, logins.get(stream.userid, ""))
+
+    def track_rename(self, stream: utils.Stream, login: str):
+        # twitch user ids never change but logins do, keep the stored stream
+        # pointing at the current login
+        login = login.lower()
+        if not login or login == stream.username:
+            return
+        old = utils.Stream(stream.url, stream.service, stream.username, stream.userid)
+        stream.username = login
+        stream.url = f"https://{stream.service}/{login}"
+        utils.update_stream(self.con, old, stream)
+        self.resolver.remember(login, stream.userid)
+        log.info(f"{old.username} was renamed to {login}, updated stored stream.")
+
+    def live_key(self, stream: utils.Stream) -> str:
+        # live state is tracked by user id, by login for streams without one
+        return stream.userid or stream.username
+
+    def get_twitch_user_ids(self) -> set[str]:
+        return {
+            stream.userid
+            for streams in self.user_streams.values()
+            for stream in streams
+            if stream.service == "twitch.tv" and stream.userid
+        }
+
     def get_user_from_stream(self, stream: utils.Stream) -> None | discord.User:
         for user_id, streams in self.user_streams.items():
             if stream in streams:
@@ -149,37 +247,132 @@ class Mumbot(discord.Client):
             message = f"{len(linked_streams + discord_streams)} live streams!"
         return color, discord.gateway.ActivityType.WATCHING, message
 
-    async def generate_thumbnail(self, username) -> bool:
-        session = Streamlink()
-        options = Options()
-        load_dotenv("./appdata/.env", override=True)
-        TWITCH_TURBO_OAUTH = os.environ.get("TWITCH_TURBO_OAUTH")
-        options.set("api-header", [("Authorization", f"OAuth {TWITCH_TURBO_OAUTH}")])
-        options.set("low-latency", True)
+    async def generate_thumbnail(
+        self, username, live: None | utils.LiveStream = None
+    ) -> None | bytes:
+        if live and self.thumbnail_mode == "twitch":
+            thumbnail = await utils.get_twitch_thumbnail(live, self.thumbnail_size)
+            if thumbnail:
+                return thumbnail
         try:
-            streams = session.streams(f"https://twitch.tv/{username}", options)
-            stream = streams["best"]
-            with stream.open() as fd:
-                await trio.sleep(1)
-                data = fd.read(1000000)
-            fname = "./appdata/stream.bin"
-            open(fname, "wb").write(data)
-            capture = cv2.VideoCapture(fname)
-            imgdata = capture.read()[1]
-            imgdata = imgdata[..., ::-1]  # BGR -> RGB
-            img = Image.fromarray(imgdata)
-            img.thumbnail((320, 180))
-            img.save("./appdata/frame.jpg")
-            return True
-        except:
-            return False
+            return await self.snapshots.get(username, self.thumbnail_profile)
+        except (utils.CaptureError, utils.FrameError):
+            return None
+
+    async def announce_live(
+        self,
+        channel: None | str,
+        message: str,
+        username: str,
+        live: None | utils.LiveStream = None,
+    ):
+        # the thumbnail capture starts right away, if it isn't ready by the
+        # deadline the announcement goes out without it and is edited later
+        thumbnail: None | bytes = None
+        ready = trio.Event()
+
+        async def capture():
+            nonlocal thumbnail
+            thumbnail = await self.generate_thumbnail(username, live)
+            ready.set()
+
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(capture)
+            with trio.move_on_after(self.ANNOUNCE_DEADLINE):
+                await ready.wait()
+            if ready.is_set():
+                if thumbnail:
+                    await self.send_file(channel, "frame.jpg", message, thumbnail)
+                else:
+                    await self.send_message(channel, message)
+                return
+            r = await self.send_message(channel, message)
+        if not thumbnail or not r or r.status_code != 200:
+            return
+        await self.edit_message_with_file(
+            r.json()["channel_id"], r.json()["id"], "frame.jpg", message, thumbnail
+        )
+
+    async def update_live(
+        self,
+        live: dict[str, utils.LiveStream],
+        checked: set[str],
+        announce: bool = True,
+        pushed: bool = False,
+    ):
+        # applies the live state of the streams in checked (keyed by live_key)
+        # from a poll or an eventsub push, and announces streams that just
+        # went live
+        now = time.monotonic()
+        if pushed:
+            self.pushed_at.update(dict.fromkeys(checked, now))
+        guild_streams = {
+            guild.id: self.get_guild_streams(guild.id) for guild in self.guilds.values()
+        }
+        went_live = []
+        went_offline = False
+        for streams in guild_streams.values():
+            for stream in streams:
+                key = self.live_key(stream)
+                if key not in checked:
+                    continue
+                pushed_at = self.pushed_at.get(key)
+                recent = pushed_at is not None and now - pushed_at < self.PUSH_GRACE
+                if not pushed and recent:
+                    continue
+                stream.is_live = key in live
+                if stream.is_live and stream.userid:
+                    self.track_rename(stream, live[key].user_login)
+                if stream.is_live and not stream.was_live:
+                    went_live.append(stream)
+                elif not stream.is_live and stream.was_live:
+                    stream.was_live = False
+                    went_offline = True
+        if went_live or went_offline:
+            await self.update_presence(*self.generate_presence_args())
+        for guild_id, streams in guild_streams.items():
+            guild = self.guilds[guild_id]
+            for stream in streams:
+                if stream not in went_live:
+                    continue
+                user = self.get_user_from_stream(stream)
+                if not user or not announce or not self.announcements:
+                    continue
+                member = guild.members[user.id]
+                metadata = live[self.live_key(stream)]
+                game = self.get_playing_game(member.user) or metadata.game_name
+                add = f", playing **{game}**" if game else ""
+                message = f"**{member}** just went live{add}!\n{stream}"
+                # announced in the background so a slow capture
+                # doesn't hold up the rest of the poll
+                self.announcements.start_soon(
+                    self.run_handler,
+                    self.announce_live,
+                    utils.get_announce_channel(self.con, guild.id),
+                    message,
+                    stream.username,
+                    metadata,
+                )
+        for stream in went_live:
+            if self.get_user_from_stream(stream):
+                stream.was_live = True
+
+    async def stream_online(self, user_id: str, login: str):
+        try:
+            live = await utils.get_twitch_client().get_streams(user_ids=[user_id])
+        except utils.TwitchError:
+            live = []
+        metadata = live[0] if live else utils.LiveStream.from_login(user_id, login)
+        await self.update_live({user_id: metadata}, {user_id}, pushed=True)
+
+    async def stream_offline(self, user_id: str, login: str):
+        await self.update_live({}, {user_id}, pushed=True)
 
 
 bot = Mumbot()
 
 # to implement for feature parity: (* critical)
 # - ding
-# - streamgif
 
 
 @bot.event
@@ -212,70 +405,68 @@ async def voice_state_update(data: dict[str, Any]):
 
 @bot.slash_command
 async def color(interaction: discord.Interaction):
-    def _name(interaction: discord.Interaction) -> str:
+    def _name(interaction: discord.Interaction) -> tuple[str, bytes]:
         name: str = interaction.data["options"][0]["value"]
-        with open("colornames.json", encoding="utf-8") as colornames:
-            colornames = json.loads(colornames.read())
-        for color in colornames:
-            if color["name"].lower() == name.lower():
-                srgb_color = sRGBColor.new_from_rgb_hex(color["hex"])
-                name = color["name"]
-                extra = "P"
-                break
-        else:
-            extra = f"I couldn't find *{name}*, but p"
-            best = 0
-            bestcolor: dict[str, str] = {}
-            for color in colornames:
-                ratio = difflib.SequenceMatcher(
-                    None, name.lower(), color["name"].lower()
-                ).ratio()
-                if ratio > best:
-                    bestcolor = color
-                    best = ratio
-            srgb_color = sRGBColor.new_from_rgb_hex(bestcolor["hex"])
-            name = bestcolor["name"]
-        utils.generate_color_swatch(srgb_color)
+        palette = utils.get_palette()
+        index, exact = utils.get_name_index().search(name)
+        extra = "P" if exact else f"I couldn't find *{name}*, but p"
+        srgb_color = sRGBColor.new_from_rgb_hex(palette.hex(index))
+        name = palette.names[index]
+        swatch = utils.generate_color_swatch(srgb_color)
         message = f"{extra}lease enjoy this {utils.get_adjective()} sample of *{name}*."
-        return message
+        return message, swatch
 
-    def _hex(interaction: discord.Interaction) -> None | str:
+    def _hex(interaction: discord.Interaction) -> None | tuple[str, bytes]:
         hex = interaction.data["options"][0]["value"]
         try:
             color = sRGBColor.new_from_rgb_hex(hex)
         except:
             return
-        utils.generate_color_swatch(color)
+        swatch = utils.generate_color_swatch(color)
         name = utils.get_color_name(color)
         message = f"Please enjoy this {utils.get_adjective()} sample of *{name}*."
-        return message
+        return message, swatch
 
-    def _random() -> str:
-        with open("colornames.json", encoding="utf-8") as colornames:
-            colornames = json.loads(colornames.read())
-        color = random.choice(colornames)
-        utils.generate_color_swatch(sRGBColor.new_from_rgb_hex(color["hex"]))
-        message = f"Please enjoy this {utils.get_adjective()} sample of *{color["name"]}*."
-        return message
+    def _random() -> tuple[str, bytes]:
+        palette = utils.get_palette()
+        index = random.randrange(len(palette))
+        swatch = utils.generate_color_swatch(
+            sRGBColor.new_from_rgb_hex(palette.hex(index))
+        )
+        message = f"Please enjoy this {utils.get_adjective()} sample of *{palette.names[index]}*."
+        return message, swatch
 
     value = interaction.data.get("options", None)
     if not value:
         await bot.interaction_response(interaction, "Thinking of a color...")
-        message = _random()
+        result = _random()
     elif value[0]["value"].startswith('#'):
         await bot.interaction_response(interaction, "Looking for your color...")
-        message = _hex(interaction)
+        result = _hex(interaction)
     else:
         await bot.interaction_response(interaction, "Looking for your color...")
-        message = _name(interaction)
-    if message:
+        result = _name(interaction)
+    if result:
+        message, swatch = result
         await bot.edit_interaction_response_with_file(
-            interaction, "./appdata/color.png", message
+            interaction, "color.png", message, swatch
         )
     else:
         await bot.edit_interaction_response(interaction, "invalid hex string")
 
 
+@bot.autocomplete
+async def color_autocomplete(interaction: discord.Interaction):
+    option = interaction.focused_option()
+    value: str = option["value"] if option else ""
+    choices: list[dict[str, str]] = []
+    if not value.startswith("#"):
+        names = utils.get_palette().names
+        for index in utils.get_name_index().complete(value):
+            choices.append({"name": names[index], "value": names[index]})
+    await bot.autocomplete_response(interaction, choices)
+
+
 @bot.slash_command
 async def setchannel(interaction: discord.Interaction):
     guild_id = interaction.guild.id
@@ -328,7 +519,7 @@ async def link(interaction: discord.Interaction):
     userid = interaction.member.user.id
     url = interaction.data["options"][0]["value"]
     new_stream = utils.Stream(url=url)
-    if not await new_stream.validate():
+    if not await new_stream.validate(bot.resolver):
         message = "couldn't validate stream"
         await bot.interaction_response(interaction, message, ephemeral)
         return
@@ -378,48 +569,27 @@ async def mystreams(interaction: discord.Interaction):
 @bot.slash_command
 async def streampic(interaction: discord.Interaction):
     streamname = interaction.data["options"][0]["value"]
-    session = Streamlink()
-    options = Options()
-    load_dotenv("./appdata/.env", override=True)
-    TWITCH_TURBO_OAUTH = os.environ.get("TWITCH_TURBO_OAUTH")
-    options.set("api-header", [("Authorization", f"OAuth {TWITCH_TURBO_OAUTH}")])
-    options.set("low-latency", True)
     message = f"Generating a streampic from *{streamname}*..."
     await bot.interaction_response(interaction, message)
     try:
-        streams = session.streams(f"https://twitch.tv/{streamname}", options)
-    except:
+        image = await bot.snapshots.get(streamname, bot.streampic_profile)
+    except utils.StreamNotFound:
         await bot.edit_interaction_response(interaction, "Couldn't find stream.")
         return
-    try:
-        stream = streams["best"]
-    except:
+    except utils.StreamOffline:
         await bot.edit_interaction_response(interaction, f"{streamname} is offline!")
         return
-    try:
-        with stream.open() as fd:
-            await trio.sleep(1)
-            data = fd.read(1000000)
-    except:
+    except utils.FrameError:
+        await bot.edit_interaction_response(interaction, "couldn't generate image")
+        return
+    except utils.CaptureError:
         await bot.edit_interaction_response(interaction, "couldn't download stream")
         return
-
-    fname = "./appdata/stream.bin"
-    open(fname, "wb").write(data)
-    try:
-        capture = cv2.VideoCapture(fname)
-        imgdata = capture.read()[1]
-        imgdata = imgdata[..., ::-1]  # BGR -> RGB
-        img = Image.fromarray(imgdata)
-        img.save("./appdata/frame.jpg")
-        message = (
-            f"Please enjoy this {utils.get_adjective()} streampic from *{streamname}*."
-        )
-        await bot.edit_interaction_response_with_file(
-            interaction, "./appdata/frame.jpg", message
-        )
-    except:
-        await bot.edit_interaction_response(interaction, "couldn't generate image")
+    message = (
+        f"Please enjoy this {utils.get_adjective()} streampic from *{streamname}*."
+    )
+    filename = f"frame.{bot.streampic_profile.extension}"
+    await bot.edit_interaction_response_with_file(interaction, filename, message, image)
 
 
 @bot.slash_command
@@ -427,6 +597,42 @@ async def sp(interaction: discord.Interaction):
     await streampic(interaction)
 
 
+@bot.slash_command
+async def streamgif(interaction: discord.Interaction):
+    options = {
+        option["name"]: option["value"] for option in interaction.data["options"]
+    }
+    streamname = options["username"]
+    format = options.get("format", "gif")
+    message = f"Generating a streamgif from *{streamname}*..."
+    await bot.interaction_response(interaction, message)
+    try:
+        animation = await bot.animations.make(streamname, format)
+    except utils.AnimationBusy:
+        await bot.edit_interaction_response(
+            interaction, "too many gifs, try again soon"
+        )
+        return
+    except utils.StreamNotFound:
+        await bot.edit_interaction_response(interaction, "Couldn't find stream.")
+        return
+    except utils.StreamOffline:
+        await bot.edit_interaction_response(interaction, f"{streamname} is offline!")
+        return
+    except utils.FrameError:
+        await bot.edit_interaction_response(interaction, "couldn't generate gif")
+        return
+    except utils.CaptureError:
+        await bot.edit_interaction_response(interaction, "couldn't download stream")
+        return
+    message = (
+        f"Please enjoy this {utils.get_adjective()} streamgif from *{streamname}*."
+    )
+    await bot.edit_interaction_response_with_file(
+        interaction, f"stream.{format}", message, animation
+    )
+
+
 @bot.slash_command
 async def namecolor(interaction: discord.Interaction):
     role_id = utils.get_rainbow_role(bot.con, interaction.guild.id)
@@ -435,7 +641,7 @@ async def namecolor(interaction: discord.Interaction):
         return
     await bot.interaction_response(interaction, "Thinking of a name for this color...")
     role = interaction.guild.roles[role_id]
-    color_name = utils.get_color_name(role.srgb_color)
+    color_name = utils.get_color_name_from_int(role.color)
     await bot.edit_interaction_response(
         interaction,
         f"I call this *{color_name}*. ({role.srgb_color.get_rgb_hex()})",
@@ -445,101 +651,66 @@ async def namecolor(interaction: discord.Interaction):
 @bot.task
 async def twitch_polling():
     first = True
-    while True:
-        await trio.sleep(5)
-        for guild in bot.guilds.values():
-            streams = bot.get_guild_streams(guild.id)
-            usernames = [stream.username for stream in streams]
-            live, success = await utils.get_live_streams_by_usernames(usernames)
+    await bot.revalidate_streams()
+    async with trio.open_nursery() as nursery:
+        bot.announcements = nursery
+        if bot.eventsub:
+            nursery.start_soon(
+                bot.run_handler, bot.eventsub.run, bot.get_twitch_user_ids
+            )
+        while True:
+            # one poll for every guild, each stream is only asked about once
+            streams = {
+                bot.live_key(stream): stream
+                for guild in bot.guilds.values()
+                for stream in bot.get_guild_streams(guild.id)
+            }
+            user_ids = sorted(s.userid for s in streams.values() if s.userid)
+            usernames = sorted(s.username for s in streams.values() if not s.userid)
+            # with every stream pushed by eventsub polling only reconciles
+            bot.poller.fallback = (
+                bool(bot.eventsub)
+                and not usernames
+                and bot.eventsub.covers(set(user_ids))
+            )
+            # the wait is paced by the requests this poll is about to make
+            bot.poller.set_lookups(len(user_ids), len(usernames))
+            await bot.poller.wait()
+            start = trio.current_time()
+            results, success = await utils.get_live_streams(user_ids, usernames)
+            bot.poller.record(success, trio.current_time() - start)
             if not success:
                 continue
-            for stream in streams:
-                if stream.username not in live:
-                    stream.is_live = False
-                    if stream.was_live:
-                        await bot.update_presence(*bot.generate_presence_args())
-                        stream.was_live = False
-                    continue
-                stream.is_live = True
-                if not stream.was_live:
-                    user = bot.get_user_from_stream(stream)
-                    if not user:
-                        continue
-                    member = guild.members[user.id]
-                    game = bot.get_playing_game(member.user)
-                    add = f", playing **{game}**" if game else ""
-                    message = f"**{member}** just went live{add}!\n{stream}"
-                    await bot.update_presence(*bot.generate_presence_args())
-                    if not first:
-                        if await bot.generate_thumbnail(stream.username):
-                            await bot.send_file(
-                                utils.get_announce_channel(bot.con, guild.id),
-                                "./appdata/frame.jpg",
-                                message,
-                            )
-                        else:
-                            await bot.send_message(
-                                utils.get_announce_channel(bot.con, guild.id), message
-                            )
-                stream.was_live = True
-        first = False
+            live = {}
+            for result in results:
+                key = result.user_id if result.user_id in streams else ""
+                live[key or result.user_login.lower()] = result
+            await bot.update_live(live, set(streams), announce=not first)
+            first = False
 
 
 @bot.task
 async def rainbow_role():
-    def generate_lab_gradient(
-        color1: sRGBColor, color2: sRGBColor, steps
-    ) -> list[sRGBColor]:
-        c1: LabColor = convert_color(color1, LabColor)
-        c2: LabColor = convert_color(color2, LabColor)
-        dl = (c1.lab_l - c2.lab_l) / steps
-        da = (c1.lab_a - c2.lab_a) / steps
-        db = (c1.lab_b - c2.lab_b) / steps
-        gradient: list[sRGBColor] = []
-        for _ in range(steps):
-            c1.lab_l -= dl
-            c1.lab_a -= da
-            c1.lab_b -= db
-            newcolor: sRGBColor = convert_color(c1, sRGBColor)
-            gradient.append(newcolor)
-        return gradient
-
-    await trio.sleep(2)
-    while True:
+    def get_targets() -> list[tuple[str, str, int]]:
+        targets = []
         for guild in bot.guilds.values():
             rainbow_role = utils.get_rainbow_role(bot.con, guild.id)
-            if not rainbow_role:
+            if not rainbow_role or rainbow_role not in guild.roles:
                 continue
             log.debug(f"Got rainbow role {rainbow_role} for guild {guild.id}")
-            if not bot.color_list:
-                current_color = guild.roles[rainbow_role].srgb_color
-                c1lab: sRGBColor = convert_color(current_color, LabColor)
-                if random.choice(range(200)) == 69:
-                    next_color: sRGBColor = sRGBColor.new_from_rgb_hex("#36393F")
-                    c2lab: LabColor = convert_color(next_color, LabColor)
-                    delta_e = delta_e_cie2000(c1lab, c2lab)
-                else:
-                    while True:
-                        next_color: sRGBColor = sRGBColor(
-                            random.random(), random.random(), random.random()
-                        )
-                        c2lab: LabColor = convert_color(next_color, LabColor)
-                        if c2lab.lab_l > 40:
-                            break
-                    delta_e = delta_e_cie2000(c1lab, c2lab)
-                if delta_e < 1:
-                    delta_e = 1
-                bot.color_list = generate_lab_gradient(
-                    current_color, next_color, int(delta_e)
-                )
+            targets.append((guild.id, rainbow_role, guild.roles[rainbow_role].color))
+        return targets
 
-            log.debug(f"gradient: {[i.get_rgb_hex() for i in bot.color_list]}")
-            nextcolor = bot.color_list.pop(0)
-            rgb = nextcolor.get_upscaled_value_tuple()
-            log.debug(f"next color: {rgb}")
-            finalcolor = 65536 * rgb[0] + 256 * rgb[1] + rgb[2]
-            await bot.update_role(guild.id, rainbow_role, finalcolor)
-        await trio.sleep(90)
+    await trio.sleep(2)
+    await bot.rainbow.run(get_targets)
+
+
+@bot.task
+async def log_metrics():
+    while True:
+        await trio.sleep(bot.METRICS_INTERVAL)
+        for name, stats in bot.metrics().items():
+            log.info(f"{name}: {json.dumps(stats)}")
 
 
 if __name__ == "__main__":
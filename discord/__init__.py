@@ -5,5 +5,6 @@ from .event import *
 from .gateway import *
 from .guild import *
 from .http_request import *
+from .interaction import *
 from .member import *
 from .user import *
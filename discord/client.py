@@ -13,6 +13,7 @@ import trio
 
 from .gateway import GatewayConnection, Opcode, DotColor
 from .http_request import HTTPRequest
+from .interaction import InteractionCallbackType
 
 if TYPE_CHECKING:
     from .guild import Guild
@@ -25,6 +26,7 @@ log = logging.getLogger(__name__)
 class Client:
     START_DELAY = 1.1
     MAX_DELAY = 60
+    AUTOCOMPLETE_BUDGET = 0.5  # seconds, discord gives up on choices after 3
 
     def __init__(self, TOKEN: str):
         self.TOKEN = TOKEN
@@ -39,7 +41,9 @@ class Client:
         self.users: dict[str, User] = {}
         self.event_listeners: dict[str, Callable] = {}
         self.interaction_listeners: dict[str, Callable] = {}
+        self.autocomplete_listeners: dict[str, Callable] = {}
         self.tasks: list[Callable] = []
+        self.nursery: None | trio.Nursery = None
 
     def get_bearer_token(self) -> None | str:
         load_dotenv("./appdata/.env", override=True)
@@ -105,12 +109,32 @@ class Client:
         self.interaction_listeners[func.__name__] = func
         return func
 
+    def autocomplete(self, func: Callable):
+        # decorator for answering autocomplete requests
+        # function name must be the command name followed by _autocomplete
+        self.autocomplete_listeners[func.__name__.removesuffix("_autocomplete")] = func
+        return func
+
     def task(self, func: Callable):
         # decorator to create looping background tasks
         # tasks will restart on disconnect/reconnect
         self.tasks.append(func)
         return func
 
+    def spawn(self, func: Callable, *args):
+        # runs an event handler alongside the gateway so that a slow command
+        # doesn't hold up receiving events or answering other commands
+        if not self.nursery:
+            log.debug(f"Dropped {func.__name__}, not connected.")
+            return
+        self.nursery.start_soon(self.run_handler, func, *args)
+
+    async def run_handler(self, func: Callable, *args):
+        try:
+            await func(*args)
+        except Exception:
+            log.exception(f"Unhandled exception in {func.__name__}:")
+
     async def on_connected(self):
         log.info("Connected!")
         self.reset_delay()
@@ -129,44 +153,88 @@ class Client:
         r = HTTPRequest()
         await r.interaction_response(interaction.id, interaction.token, payload)
 
+    async def autocomplete_response(
+        self, interaction: Interaction, choices: list[dict[str, str]]
+    ):
+        # choices are {"name": ..., "value": ...}, discord shows at most 25
+        payload = {
+            "type": InteractionCallbackType.AUTOCOMPLETE_RESULT,
+            "data": {"choices": choices[:25]},
+        }
+        r = HTTPRequest()
+        await r.interaction_response(interaction.id, interaction.token, payload)
+
     async def edit_interaction_response(self, interaction: Interaction, message: str):
         payload = {"content": message}
         r = HTTPRequest()
         await r.edit_interaction_response(interaction.token, payload)
 
     async def edit_interaction_response_with_file(
-        self, interaction: Interaction, filename: str, message: str
+        self,
+        interaction: Interaction,
+        filename: str,
+        message: str,
+        data: None | bytes = None,
     ):
+        # uploads data from memory if given, otherwise reads filename from disk
         pj = {"content": message}
         pj2 = {"payload_json": json.dumps(pj)}
-        file = {"file": (filename, open(filename, "rb"))}
+        file = {"file": (filename, self.read_file(filename, data))}
         r = HTTPRequest()
         await r.edit_interaction_response_with_file(interaction.token, pj2, file)
 
-    async def send_message(self, channel: Optional[str], message: str):
+    async def send_message(
+        self, channel: Optional[str], message: str
+    ) -> None | httpx.Response:
         if not channel:
             log.debug("Tried to send a message, but had no channel.")
             return
         payload = {"content": message}
         r = HTTPRequest()
-        await r.create_message(channel, payload)
+        return await r.create_message(channel, payload)
 
     async def send_file(
-        self, channel: Optional[str], filename: str, message: None | str = None
+        self,
+        channel: Optional[str],
+        filename: str,
+        message: None | str = None,
+        data: None | bytes = None,
     ):
         if not channel:
             log.debug("Tried to send a message, but had no channel.")
             return
         pj = {"content": message}
         pj2 = {"payload_json": json.dumps(pj)}
-        file = {"file": (filename, open(filename, "rb"))}
+        file = {"file": (filename, self.read_file(filename, data))}
         r = HTTPRequest()
         await r.create_message_with_file(channel, pj2, file)
 
-    async def update_role(self, guild_id, role_id: str, color: int):
+    async def edit_message_with_file(
+        self,
+        channel: str,
+        message_id: str,
+        filename: str,
+        message: None | str = None,
+        data: None | bytes = None,
+    ):
+        pj = {"content": message}
+        pj2 = {"payload_json": json.dumps(pj)}
+        file = {"file": (filename, self.read_file(filename, data))}
+        r = HTTPRequest()
+        await r.edit_message_with_file(channel, message_id, pj2, file)
+
+    def read_file(self, filename: str, data: None | bytes = None) -> bytes:
+        if data is not None:
+            return data
+        with open(filename, "rb") as file:
+            return file.read()
+
+    async def update_role(
+        self, guild_id, role_id: str, color: int
+    ) -> None | httpx.Response:
         payload = {"color": color}
         r = HTTPRequest()
-        await r.modify_guild_role(guild_id, role_id, payload)
+        return await r.modify_guild_role(guild_id, role_id, payload)
 
     async def send_gateway_message(self, message: dict[str, Any]):
         if not self.gateway_channel:
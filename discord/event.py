@@ -2,12 +2,13 @@ from __future__ import annotations
 
 import json
 import logging
+import time
 from inspect import iscoroutinefunction
 from typing import TYPE_CHECKING, Any
 
 from .channel import Channel
 from .guild import Guild
-from .interaction import Interaction
+from .interaction import Interaction, InteractionType
 from .member import GuildMember
 from .user import User
 
@@ -126,7 +127,23 @@ class Event:
     async def handle_interaction_create(self):
         guild = self.client.guilds[self.data["guild_id"]]
         interaction = Interaction(guild, self.data)
-        if interaction.name in self.client.interaction_listeners.keys():
-            await self.client.interaction_listeners[interaction.name](interaction)
+        if interaction.type == InteractionType.AUTOCOMPLETE:
+            self.client.spawn(self.handle_autocomplete, interaction)
+        elif interaction.name in self.client.interaction_listeners.keys():
+            self.client.spawn(
+                self.client.interaction_listeners[interaction.name], interaction
+            )
         else:
             log.debug(f"Received unknown slash command '{interaction.name}'")
+
+    async def handle_autocomplete(self, interaction: Interaction):
+        if interaction.name not in self.client.autocomplete_listeners.keys():
+            log.debug(f"Received unknown autocomplete for '{interaction.name}'")
+            return
+        start = time.perf_counter()
+        await self.client.autocomplete_listeners[interaction.name](interaction)
+        elapsed = time.perf_counter() - start
+        if elapsed > self.client.AUTOCOMPLETE_BUDGET:
+            log.warning(
+                f"Autocomplete for '{interaction.name}' took {elapsed * 1000:.0f} ms."
+            )
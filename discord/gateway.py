@@ -76,6 +76,7 @@ class GatewayConnection:
                 await self.client.on_connected()
                 try:
                     async with trio.open_nursery() as nursery:
+                        self.client.nursery = nursery
                         # memory channel to initialize heartbeat function with correct interval
                         send_hb_info, receive_hb_info = trio.open_memory_channel(0)
 
@@ -162,6 +162,13 @@ class HTTPRequest:
         method = "PATCH"
         return await self.send(method, route, payload)
 
+    async def edit_message_with_file(
+        self, channel_id: str, message_id: str, payload: dict[str, Any], file
+    ) -> None | httpx.Response:
+        route = f"/channels/{channel_id}/messages/{message_id}"
+        method = "PATCH"
+        return await self.send(method, route, payload, file)
+
     async def delete_message(
         self, channel_id: str, message_id: str, payload: Payload = None
     ) -> None | httpx.Response:
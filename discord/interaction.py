@@ -15,12 +15,26 @@ class InteractionType(IntEnum):
     AUTOCOMPLETE = 4
 
 
+class InteractionCallbackType(IntEnum):
+    CHANNEL_MESSAGE_WITH_SOURCE = 4
+    DEFERRED_CHANNEL_MESSAGE_WITH_SOURCE = 5
+    AUTOCOMPLETE_RESULT = 8
+
+
 class Interaction:
     def __init__(self, guild: Guild, data: dict[str, Any]):
         self.guild = guild
         self.id: str = data["id"]
+        self.type: int = data["type"]
         self.token: str = data["token"]
         self.channel: Channel = self.guild.channels[data["channel_id"]]
         self.member: GuildMember = self.guild.members[data["member"]["user"]["id"]]
         self.data: dict[str, Any] = data["data"]
         self.name: str = self.data["name"]
+
+    def focused_option(self) -> None | dict[str, Any]:
+        # the option the user is typing in, for autocomplete interactions
+        for option in self.data.get("options", []):
+            if option.get("focused", False):
+                return option
+        return None
@@ -0,0 +1,107 @@
+# local stand-in for twitch's eventsub websocket and its helix subscription
+# endpoint, for driving utils.EventSubClient in tests and benchmarks
+import json
+import time
+import uuid
+
+import httpx
+import trio
+from trio_websocket import ConnectionClosed, WebSocketRequest
+
+COST_LIMIT = 6  # subscriptions the stand-in accepts per session, like twitch's
+
+
+class StandInEventSub:
+    # follows twitch's session rules: subscriptions belong to a session and
+    # are dropped when its connection closes, unless a connection to the
+    # session's reconnect url was welcomed first, after which the old
+    # connection is closed
+
+    def __init__(self, cost_limit: int = COST_LIMIT):
+        self.port = 0
+        self.cost_limit = cost_limit
+        self.sessions: dict[str, trio.MemorySendChannel] = {}
+        self.subscriptions: dict[str, list[str]] = {}  # session id -> user ids
+        self.subscription_requests = 0
+        self.silent = False
+
+    @property
+    def subscribed(self) -> set[str]:
+        return {u for user_ids in self.subscriptions.values() for u in user_ids}
+
+    def message(self, message_type: str, payload: dict) -> str:
+        metadata = {
+            "message_id": str(uuid.uuid4()),
+            "message_type": message_type,
+            "message_timestamp": time.time(),
+        }
+        return json.dumps({"metadata": metadata, "payload": payload})
+
+    async def handler(self, request: WebSocketRequest):
+        ws = await request.accept()
+        session_id = str(uuid.uuid4())
+        old = None
+        if request.path.startswith("/reconnect/"):
+            old = request.path.split("/")[-1]
+            if old not in self.sessions:
+                # too late, the old session and its subscriptions are gone
+                await ws.aclose(4007, "invalid reconnect")
+                return
+            self.subscriptions[session_id] = self.subscriptions.pop(old, [])
+        send, receive = trio.open_memory_channel(16)
+        self.sessions[session_id] = send
+        try:
+            session = {"id": session_id, "keepalive_timeout_seconds": 1}
+            await ws.send_message(self.message("session_welcome", {"session": session}))
+            if old in self.sessions:
+                await self.sessions[old].send(None)
+            while True:
+                with trio.move_on_after(0.5):
+                    message = await receive.receive()
+                    if message is None:
+                        await ws.aclose(4004, "reconnected")
+                        return
+                    await ws.send_message(message)
+                    continue
+                if not self.silent:
+                    await ws.send_message(self.message("session_keepalive", {}))
+        except ConnectionClosed:
+            pass
+        finally:
+            del self.sessions[session_id]
+            self.subscriptions.pop(session_id, None)
+
+    def helix(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        session_id = body["transport"]["session_id"]
+        if session_id not in self.sessions:
+            return httpx.Response(400, json={"message": "session not connected"})
+        self.subscription_requests += 1
+        user_ids = self.subscriptions.setdefault(session_id, [])
+        user_id = body["condition"]["broadcaster_user_id"]
+        if user_id in user_ids and body["type"] == "stream.offline":
+            return httpx.Response(202, json={"data": [body]})
+        if len(user_ids) >= self.cost_limit:
+            return httpx.Response(429, json={"message": "max total cost exceeded"})
+        user_ids.append(user_id)
+        return httpx.Response(202, json={"data": [body]})
+
+    async def send(self, message: str):
+        for channel in list(self.sessions.values()):
+            await channel.send(message)
+
+    async def notify(self, user_id: str, kind: str):
+        event = {
+            "broadcaster_user_id": user_id,
+            "broadcaster_user_login": f"u{user_id}",
+        }
+        payload = {"subscription": {"type": kind}, "event": event}
+        for session_id, channel in list(self.sessions.items()):
+            if user_id in self.subscriptions.get(session_id, []):
+                await channel.send(self.message("notification", payload))
+
+    async def reconnect(self, url: str = ""):
+        for session_id, channel in list(self.sessions.items()):
+            reconnect_url = url or f"ws://127.0.0.1:{self.port}/reconnect/{session_id}"
+            payload = {"session": {"id": session_id, "reconnect_url": reconnect_url}}
+            await channel.send(self.message("session_reconnect", payload))
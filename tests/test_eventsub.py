@@ -0,0 +1,167 @@
+# eventsub client against the local stand-in server in tests.eventsub_server
+# run from the repository root: python -m unittest
+import unittest
+from typing import Awaitable, Callable
+
+import httpx
+import trio
+from trio_websocket import serve_websocket
+
+import utils
+from tests.eventsub_server import COST_LIMIT, StandInEventSub
+
+STREAMS = 8
+
+
+class EventSubTest(unittest.TestCase):
+    def run_client(
+        self,
+        test: Callable[[StandInEventSub, utils.EventSubClient], Awaitable[None]],
+        on_online=None,
+    ):
+        self.online: list[str] = []
+        self.disconnects = 0
+
+        async def record_online(user_id: str, login: str):
+            self.online.append(user_id)
+
+        async def on_offline(user_id: str, login: str):
+            pass
+
+        def on_disconnect():
+            self.disconnects += 1
+
+        async def main():
+            server = StandInEventSub()
+            twitch = utils.TwitchClient(
+                "client id", utils.TokenManager("client id", path=None)
+            )
+            twitch.http = httpx.AsyncClient(transport=httpx.MockTransport(server.helix))
+            user_ids = {str(i) for i in range(STREAMS)}
+            async with trio.open_nursery() as nursery:
+                listener = await nursery.start(
+                    serve_websocket, server.handler, "127.0.0.1", 0, None
+                )
+                server.port = listener.port
+                client = utils.EventSubClient(
+                    twitch,
+                    "user token",
+                    on_online or record_online,
+                    on_offline,
+                    f"ws://127.0.0.1:{server.port}/ws",
+                )
+                client.KEEPALIVE_GRACE = 0.5
+                client.DRAIN_TIMEOUT = 0.1
+                client.on_disconnect = on_disconnect
+                nursery.start_soon(client.run, lambda: user_ids)
+                with trio.fail_after(10):
+                    await wait_until(lambda: client.subscribed)
+                    await test(server, client)
+                nursery.cancel_scope.cancel()
+
+        trio.run(main)
+
+    def test_subscribes_up_to_cost_limit(self):
+        async def test(server: StandInEventSub, client: utils.EventSubClient):
+            self.assertEqual(len(client.subscribed), COST_LIMIT)
+            self.assertEqual(len(client.refused), STREAMS - COST_LIMIT)
+            self.assertEqual(server.subscribed, client.subscribed)
+            self.assertFalse(client.covers({str(i) for i in range(STREAMS)}))
+            self.assertTrue(client.covers(set(client.subscribed)))
+
+        self.run_client(test)
+
+    def test_pushes_go_live(self):
+        async def test(server: StandInEventSub, client: utils.EventSubClient):
+            for user_id in sorted(client.subscribed):
+                await server.notify(user_id, "stream.online")
+            await wait_until(lambda: len(self.online) == COST_LIMIT)
+            self.assertEqual(set(self.online), client.subscribed)
+            self.assertEqual(client.events, COST_LIMIT)
+
+        self.run_client(test)
+
+    def test_reconnect_keeps_subscriptions(self):
+        async def test(server: StandInEventSub, client: utils.EventSubClient):
+            subscribed = set(client.subscribed)
+            requests = server.subscription_requests
+            await server.reconnect()
+            await wait_until(lambda: client.reconnects == 1)
+            # twitch closes the old connection once the new one is welcomed
+            await wait_until(lambda: len(server.sessions) == 1)
+            self.assertEqual(server.subscribed, subscribed)
+            self.assertEqual(client.subscribed, subscribed)
+            self.assertEqual(server.subscription_requests, requests)
+            self.assertEqual(self.disconnects, 0)
+            user_id = min(subscribed)
+            await server.notify(user_id, "stream.online")
+            await wait_until(lambda: self.online)
+            self.assertEqual(self.online, [user_id])
+
+        self.run_client(test)
+
+    def test_failed_reconnect_resubscribes(self):
+        async def test(server: StandInEventSub, client: utils.EventSubClient):
+            session_id = client.session_id
+            await server.reconnect(f"ws://127.0.0.1:{server.port}/reconnect/gone")
+            await wait_until(lambda: self.disconnects)
+            self.assertFalse(client.covers(set(server.subscribed)))
+            await wait_until(lambda: client.connected and client.subscribed)
+            self.assertNotEqual(client.session_id, session_id)
+            self.assertEqual(client.reconnects, 0)
+            self.assertEqual(server.subscribed, client.subscribed)
+
+        self.run_client(test)
+
+    def test_dead_connection_resubscribes(self):
+        async def test(server: StandInEventSub, client: utils.EventSubClient):
+            server.silent = True
+            await wait_until(lambda: not client.connected)
+            self.assertEqual(self.disconnects, 1)
+            self.assertFalse(client.subscribed)
+            server.silent = False
+            await wait_until(lambda: client.connected and client.subscribed)
+            self.assertEqual(server.subscribed, client.subscribed)
+
+        self.run_client(test)
+
+    def test_ignores_malformed_messages(self):
+        async def test(server: StandInEventSub, client: utils.EventSubClient):
+            await server.send(server.message("notification", {"event": {}}))
+            user_id = min(client.subscribed)
+            await server.notify(user_id, "stream.online")
+            await wait_until(lambda: self.online)
+            self.assertEqual(self.disconnects, 0)
+            self.assertEqual(client.events, 1)
+
+        self.run_client(test)
+
+    def test_unexpected_errors_disconnect(self):
+        async def test(server: StandInEventSub, client: utils.EventSubClient):
+            await server.send("not json")
+            await wait_until(lambda: self.disconnects)
+            self.assertFalse(client.covers(set(server.subscribed)))
+            await wait_until(lambda: client.connected and client.subscribed)
+
+        self.run_client(test)
+
+    def test_callback_errors_are_not_swallowed(self):
+        async def on_online(user_id: str, login: str):
+            raise KeyError(user_id)
+
+        async def test(server: StandInEventSub, client: utils.EventSubClient):
+            await server.notify(min(client.subscribed), "stream.online")
+            await wait_until(lambda: self.disconnects)
+            self.assertFalse(client.connected)
+
+        with self.assertLogs("utils.eventsub", "ERROR"):
+            self.run_client(test, on_online)
+
+
+async def wait_until(predicate: Callable[[], object]):
+    while not predicate():
+        await trio.sleep(0.01)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,18 @@
+from .animation import *
+from .cache import *
+from .capture import *
+from .colorspace import *
+from .eventsub import *
+from .frames import *
+from .gradient import *
+from .kdtree import *
+from .namesearch import *
+from .palette import *
+from .polling import *
 from .queries import *
+from .rainbow import *
+from .resolver import *
+from .sessions import *
 from .stream import *
 from .twitch import *
 from .utils import *
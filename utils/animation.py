@@ -0,0 +1,89 @@
+from __future__ import annotations
+import logging
+import time
+import cv2
+import numpy
+import trio
+
+from .capture import CaptureError, CaptureService, CaptureTimeout, format_stats
+from .frames import FrameError, decode_frames, encode_animation
+
+log = logging.getLogger(__name__)
+
+
+class AnimationBusy(CaptureError):
+    pass
+
+
+class AnimationMaker:
+    # short animated clips of a stream, every stage is capped so a single
+    # request can't tie up the capture threads or blow up memory
+
+    MAX_JOBS = 1  # clips encoded at once
+    MAX_WAITING = 2  # clips queued behind those before new ones are refused
+    SECONDS = 4  # seconds of stream per clip
+    FPS = 10
+    MAX_FRAMES = 40
+    MAX_SIZE = (480, 270)
+    MAX_STREAM_BYTES = 6000000  # stream data read per clip
+    MAX_UPLOAD = 8000000  # discord's upload limit, with some room to spare
+    MAX_ATTEMPTS = 3  # encodes tried, each smaller than the last
+    TIMEOUT = 45  # seconds from request to finished file
+
+    def __init__(self, capture: CaptureService, max_jobs: int = MAX_JOBS):
+        self.capture = capture
+        self.limiter = trio.CapacityLimiter(max_jobs)
+
+    async def make(self, username: str, format: str = "gif") -> bytes:
+        # gif or webp of username's stream, raises a CaptureError or FrameError
+        waiting = self.limiter.statistics().tasks_waiting
+        if waiting >= self.MAX_WAITING:
+            raise AnimationBusy(username)
+        stats: dict[str, float] = {}
+        try:
+            with trio.fail_after(self.TIMEOUT):
+                async with self.limiter:
+                    data = await self.capture.record(
+                        username, self.SECONDS, self.MAX_STREAM_BYTES, stats
+                    )
+                    # not abandoned on timeout, the encode keeps its job slot
+                    # until it's done and the timeout lands right after
+                    start = time.perf_counter()
+                    animation = await trio.to_thread.run_sync(
+                        self.encode, data, format, stats
+                    )
+                    stats["encode"] = time.perf_counter() - start
+        except trio.TooSlowError:
+            log.warning(f"Animation of {username} timed out after {self.TIMEOUT}s.")
+            raise CaptureTimeout(username)
+        log.info(
+            f"Animation of {username} ({len(animation)} bytes): {format_stats(stats)}."
+        )
+        return animation
+
+    def encode(self, data: bytes, format: str, stats: dict[str, float]) -> bytes:
+        frames = list(decode_frames(data, self.FPS, self.MAX_FRAMES, self.MAX_SIZE))
+        if not frames:
+            raise FrameError("couldn't decode any frames")
+        # frames must share a size, a resolution switch mid clip ends it
+        shape = frames[0].shape
+        frames = [frame for frame in frames if frame.shape == shape]
+        stats["frames"] = len(frames)
+        fps = self.FPS
+        for _ in range(self.MAX_ATTEMPTS):
+            animation = encode_animation(frames, fps, format)
+            if len(animation) <= self.MAX_UPLOAD:
+                return animation
+            # scale down by the overshoot, and drop every other frame too
+            # when it's way over
+            ratio = len(animation) / self.MAX_UPLOAD
+            frames = [shrink(frame, min(0.9, ratio**-0.5)) for frame in frames]
+            if ratio > 2 and len(frames) > 1:
+                frames, fps = frames[::2], fps / 2
+        raise FrameError("couldn't fit the animation under the upload limit")
+
+
+def shrink(frame: numpy.ndarray, scale: float) -> numpy.ndarray:
+    height, width = frame.shape[:2]
+    size = (max(round(width * scale), 1), max(round(height * scale), 1))
+    return cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
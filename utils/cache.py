@@ -0,0 +1,75 @@
+from __future__ import annotations
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, TypeVar
+
+log = logging.getLogger(__name__)
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    # bounded mapping that drops the least recently used entry when full,
+    # and entries older than ttl seconds if a ttl is given
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, V] = OrderedDict()
+        self.expires: dict[Hashable, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries and not self.expired(key)
+
+    def expired(self, key: Hashable) -> bool:
+        if key in self.expires and self.expires[key] <= time.monotonic():
+            del self.entries[key]
+            del self.expires[key]
+            return True
+        return False
+
+    def get(self, key: Hashable) -> Optional[V]:
+        if self.expired(key):
+            self.misses += 1
+            return None
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: V):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if self.ttl is not None:
+            self.expires[key] = time.monotonic() + self.ttl
+        while len(self.entries) > self.maxsize:
+            oldest, _ = self.entries.popitem(last=False)
+            self.expires.pop(oldest, None)
+
+    def discard(self, key: Hashable):
+        self.entries.pop(key, None)
+        self.expires.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+        self.expires.clear()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
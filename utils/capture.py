@@ -0,0 +1,396 @@
+from __future__ import annotations
+import functools
+import io
+import logging
+import threading
+import time
+import numpy
+import trio
+from typing import Any, Callable, Optional, TypeVar
+
+from .cache import LRUCache
+from .frames import (
+    IN_MEMORY_DECODE,
+    FrameError,
+    ImageProfile,
+    decode_first_frame,
+    encode_jpeg,
+    render_jpeg,
+)
+from .sessions import SessionPool
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CaptureError(Exception):
+    pass
+
+
+class StreamNotFound(CaptureError):
+    pass
+
+
+class StreamOffline(CaptureError):
+    pass
+
+
+class CaptureTimeout(CaptureError):
+    pass
+
+
+class StreamReader(io.BufferedIOBase):
+    # a live stream as a file opencv can decode from while it downloads,
+    # ending at the byte or time cap; everything read is kept, so opencv can
+    # seek back while probing
+
+    def __init__(self, fd, chunk_size: int, max_bytes: int, deadline: float):
+        super().__init__()
+        self.fd = fd
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.deadline = deadline  # time.perf_counter() time
+        self.buffer = bytearray()
+        self.position = 0
+        self.ended = False
+        self.error: Optional[Exception] = None
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def fill(self, size: int):
+        # reads from the stream until size bytes are buffered or it ends
+        while len(self.buffer) < size and not self.ended:
+            if (
+                len(self.buffer) >= self.max_bytes
+                or time.perf_counter() >= self.deadline
+            ):
+                self.ended = True
+                break
+            try:
+                chunk = self.fd.read(self.chunk_size)
+            except Exception as e:
+                # raised inside opencv it would only end the video, so it's
+                # kept for the caller
+                self.error = e
+                self.ended = True
+                break
+            if not chunk:
+                self.ended = True
+            self.buffer.extend(chunk)
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.max_bytes
+        self.fill(self.position + size)
+        data = bytes(self.buffer[self.position : self.position + size])
+        self.position += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_END:
+            # a live stream has no end to seek from
+            return -1
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        self.position = max(offset, 0)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+
+class CaptureService:
+    # streamlink is blocking, so resolving streams and reading segments runs
+    # in worker threads while the trio loop keeps handling the gateway
+
+    MAX_CONCURRENT = 3  # captures allowed in flight at once
+    TIMEOUT = 20  # seconds, includes waiting for a free slot
+    CHUNK_SIZE = 65536  # bytes per read from the stream
+    FIRST_PROBE = 131072  # bytes before the first decode attempt, older opencv
+    MAX_BYTES = 2000000  # stop reading here even if nothing decoded yet
+    MAX_READ_TIME = 8  # seconds, same but for slow streams
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT, timeout: float = TIMEOUT):
+        # a plain semaphore taken by the worker thread itself rather than a
+        # trio limiter, an abandoned thread that outlives the trio run (a
+        # gateway reconnect) would never give a trio limiter's slot back
+        self.slots = threading.Semaphore(max_concurrent)
+        self.timeout = timeout
+        self.sessions = SessionPool(max_concurrent)
+
+    def resolve(self, username: str, fresh: bool = False) -> tuple[Any, bool]:
+        # (best stream for username, whether it came from the resolve cache)
+        if not fresh:
+            stream = self.sessions.cached(username)
+            if stream is not None:
+                return stream, True
+        try:
+            streams = self.sessions.streams(username)
+        except Exception as e:
+            raise StreamNotFound(username) from e
+        try:
+            stream = streams["best"]
+        except KeyError:
+            raise StreamOffline(username)
+        self.sessions.remember(username, stream)
+        return stream, False
+
+    def limited(self, deadline: float, func: Callable[..., T], *args) -> T:
+        # runs func in the worker thread once a slot is free; a thread that
+        # was abandoned while waiting gives up at the caller's deadline
+        # (time.monotonic()) instead of capturing for nobody
+        if not self.slots.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            raise CaptureTimeout("no free capture slot")
+        try:
+            return func(*args)
+        finally:
+            self.slots.release()
+
+    def fetch(
+        self,
+        username: str,
+        read: Callable[[Any, dict[str, float]], T],
+        stats: dict[str, float],
+        requested: float,
+    ) -> T:
+        # a cached stream can go stale (stream ended, playlist token expired),
+        # so a failed read on one resolves again before giving up
+        start = time.perf_counter()
+        stats["queue"] = start - requested
+        stream, cached = self.resolve(username)
+        stats["resolve"] = time.perf_counter() - start
+        try:
+            return read(stream, stats)
+        except CaptureError:
+            self.sessions.forget(username)
+            if not cached:
+                raise
+        log.debug(f"Cached stream for {username} went stale, resolving again.")
+        start = time.perf_counter()
+        stream, _ = self.resolve(username, fresh=True)
+        stats["resolve"] += time.perf_counter() - start
+        return read(stream, stats)
+
+    def read(
+        self, stream, stats: dict[str, float]
+    ) -> tuple[bytes, Optional[numpy.ndarray]]:
+        # reads until the first full frame decodes, or until the byte or
+        # time cap is reached
+        start = time.perf_counter()
+        try:
+            with stream.open() as fd:
+                reader = StreamReader(
+                    fd, self.CHUNK_SIZE, self.MAX_BYTES, start + self.MAX_READ_TIME
+                )
+                frame = self.decode(reader)
+                if frame is not None:
+                    stats["first_frame"] = time.perf_counter() - start
+        except Exception as e:
+            raise CaptureError(f"couldn't download stream: {e}") from e
+        if frame is None and reader.error:
+            error = reader.error
+            raise CaptureError(f"couldn't download stream: {error}") from error
+        stats["read"] = time.perf_counter() - start
+        stats["bytes"] = len(reader.buffer)
+        return bytes(reader.buffer), frame
+
+    def decode(self, reader: StreamReader) -> Optional[numpy.ndarray]:
+        if IN_MEMORY_DECODE:
+            # opencv pulls from the stream as it downloads, so the frame is
+            # decoded once, as soon as enough of the stream is in
+            try:
+                return decode_first_frame(reader)
+            except FrameError:
+                return None
+        # older opencv decodes from a file, tried again each time the
+        # buffer doubles
+        probe = self.FIRST_PROBE
+        while True:
+            reader.fill(probe)
+            try:
+                return decode_first_frame(bytes(reader.buffer))
+            except FrameError:
+                if reader.ended:
+                    return None
+            probe = len(reader.buffer) * 2
+
+    def read_clip(
+        self, stream, stats: dict[str, float], seconds: float, max_bytes: int
+    ) -> bytes:
+        # reads for about seconds of wall time, streamlink starts a few
+        # segments behind live so this holds at least that much video
+        buffer = bytearray()
+        start = time.perf_counter()
+        try:
+            with stream.open() as fd:
+                while len(buffer) < max_bytes:
+                    chunk = fd.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    buffer.extend(chunk)
+                    if time.perf_counter() - start >= seconds:
+                        break
+        except Exception as e:
+            raise CaptureError(f"couldn't download stream: {e}") from e
+        stats["read"] = time.perf_counter() - start
+        stats["bytes"] = len(buffer)
+        return bytes(buffer[:max_bytes])
+
+    async def grab(
+        self, username: str, stats: Optional[dict[str, float]] = None
+    ) -> tuple[bytes, Optional[numpy.ndarray]]:
+        # stream data for username and its first frame if one decoded,
+        # raises a CaptureError on failure
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        try:
+            with trio.fail_after(self.timeout):
+                # the thread holds its slot until it really finishes, an
+                # abandoned read still counts against the limit
+                data, frame = await trio.to_thread.run_sync(
+                    self.limited,
+                    time.monotonic() + self.timeout,
+                    self.fetch,
+                    username,
+                    self.read,
+                    stats,
+                    start,
+                    abandon_on_cancel=True,
+                )
+        except trio.TooSlowError:
+            log.warning(f"Capture of {username} timed out after {self.timeout}s.")
+            raise CaptureTimeout(username)
+        log.debug(f"Captured {len(data)} bytes from {username}.")
+        return data, frame
+
+    async def record(
+        self,
+        username: str,
+        seconds: float,
+        max_bytes: int,
+        stats: Optional[dict[str, float]] = None,
+    ) -> bytes:
+        # about seconds of stream data for username, at most max_bytes
+        stats = {} if stats is None else stats
+        read = functools.partial(self.read_clip, seconds=seconds, max_bytes=max_bytes)
+        start = time.perf_counter()
+        try:
+            with trio.fail_after(self.timeout + seconds):
+                data = await trio.to_thread.run_sync(
+                    self.limited,
+                    time.monotonic() + self.timeout + seconds,
+                    self.fetch,
+                    username,
+                    read,
+                    stats,
+                    start,
+                    abandon_on_cancel=True,
+                )
+        except trio.TooSlowError:
+            log.warning(f"Recording {username} timed out.")
+            raise CaptureTimeout(username)
+        log.debug(f"Recorded {len(data)} bytes from {username}.")
+        return data
+
+    async def snapshot(
+        self, username: str, size: Optional[tuple[int, int]] = None
+    ) -> bytes:
+        # jpeg of the current frame of username's stream, optionally shrunk to fit size
+        stats: dict[str, float] = {}
+        _, frame = await self.grab(username, stats)
+        if frame is None:
+            raise FrameError(f"couldn't decode a frame from {username}")
+        start = time.perf_counter()
+        try:
+            jpeg = await trio.to_thread.run_sync(encode_jpeg, frame, size)
+        except Exception as e:
+            raise FrameError(f"couldn't generate image: {e}") from e
+        stats["encode"] = time.perf_counter() - start
+        log.info(f"Snapshot of {username} ({len(jpeg)} bytes): {format_stats(stats)}.")
+        return jpeg
+
+
+def format_stats(stats: dict[str, float]) -> str:
+    parts = []
+    for key, value in stats.items():
+        if key == "bytes":
+            parts.append(f"{int(value)} bytes read")
+        elif key == "frames":
+            parts.append(f"{int(value)} frames")
+        else:
+            parts.append(f"{key} {value * 1000:.0f} ms")
+    return ", ".join(parts)
+
+
+class Flight:
+    # one capture in progress that any number of callers can wait on
+    def __init__(self):
+        self.done = trio.Event()
+        self.result: Optional[bytes] = None
+        self.error: Optional[Exception] = None
+
+
+class SnapshotCache:
+    # recent full size snapshots per streamer, concurrent requests for the
+    # same streamer share a single capture, and each upload is encoded from
+    # the cached snapshot with its own profile
+
+    TTL = 15  # seconds a snapshot is reused for
+    MAX_ENTRIES = 32
+
+    def __init__(
+        self,
+        capture: CaptureService,
+        ttl: float = TTL,
+        max_entries: int = MAX_ENTRIES,
+    ):
+        self.capture = capture
+        self.cache: LRUCache[bytes] = LRUCache(max_entries, ttl)
+        self.in_flight: dict[str, Flight] = {}
+        self.coalesced = 0
+
+    async def get(self, username: str, profile: Optional[ImageProfile] = None) -> bytes:
+        # image of username's stream, re-encoded with profile if one is given
+        key = username.lower()
+        jpeg = self.cache.get(key)
+        if jpeg is None:
+            jpeg = await self.fetch(key)
+        if not profile:
+            return jpeg
+        image, timings = await trio.to_thread.run_sync(render_jpeg, jpeg, profile)
+        log.info(
+            f"Rendered {key} with {profile}: {len(jpeg)} -> {len(image)} bytes, "
+            f"{format_stats(timings)}."
+        )
+        return image
+
+    async def fetch(self, key: str) -> bytes:
+        flight = self.in_flight.get(key)
+        if flight:
+            self.coalesced += 1
+            await flight.done.wait()
+            if flight.result is None:
+                raise flight.error or CaptureError(f"capture of {key} failed")
+            return flight.result
+        flight = self.in_flight[key] = Flight()
+        try:
+            flight.result = await self.capture.snapshot(key)
+            self.cache.put(key, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            del self.in_flight[key]
+            flight.done.set()
+
+    def stats(self) -> dict[str, Any]:
+        stats = self.cache.stats()
+        stats["coalesced"] = self.coalesced
+        stats["in_flight"] = len(self.in_flight)
+        return stats
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import numpy
+
+# vectorized versions of the colormath sRGB <-> XYZ <-> Lab conversions
+# constants are the ones colormath uses, so results match convert_color()
+
+SRGB_TO_XYZ = numpy.array(
+    [
+        [0.412424, 0.357579, 0.180464],
+        [0.212656, 0.715158, 0.0721856],
+        [0.0193324, 0.119193, 0.950444],
+    ]
+)
+XYZ_TO_SRGB = numpy.array(
+    [
+        [3.24071, -1.53726, -0.498571],
+        [-0.969258, 1.87599, 0.0415557],
+        [0.0556352, -0.203996, 1.05707],
+    ]
+)
+D65 = numpy.array([0.95047, 1.00000, 1.08883])
+CIE_E = 216.0 / 24389.0
+
+
+def hex_to_rgb(hex_str: str) -> tuple[int, int, int]:
+    hex_str = hex_str.strip().lstrip("#")
+    if len(hex_str) != 6:
+        raise ValueError(f"input #{hex_str} is not in #RRGGBB format")
+    value = int(hex_str, 16)
+    return (value >> 16, (value >> 8) & 255, value & 255)
+
+
+def srgb_to_lab(srgb: numpy.ndarray) -> numpy.ndarray:
+    # srgb is an (..., 3) array of 0-1 values, returns (..., 3) Lab (d65)
+    v = numpy.asarray(srgb, dtype=numpy.float64)
+    linear = numpy.where(v <= 0.04045, v / 12.92, ((v + 0.055) / 1.055) ** 2.4)
+    xyz = numpy.maximum(linear @ SRGB_TO_XYZ.T, 0.0) / D65
+    f = numpy.where(xyz > CIE_E, numpy.cbrt(xyz), 7.787 * xyz + 16.0 / 116.0)
+    lab = numpy.empty_like(f)
+    lab[..., 0] = 116.0 * f[..., 1] - 16.0
+    lab[..., 1] = 500.0 * (f[..., 0] - f[..., 1])
+    lab[..., 2] = 200.0 * (f[..., 1] - f[..., 2])
+    return lab
+
+
+def lab_to_srgb(lab: numpy.ndarray) -> numpy.ndarray:
+    # lab is an (..., 3) array (d65), returns (..., 3) sRGB values which can be
+    # outside 0-1 for colors outside the sRGB gamut
+    lab = numpy.asarray(lab, dtype=numpy.float64)
+    f = numpy.empty_like(lab)
+    f[..., 1] = (lab[..., 0] + 16.0) / 116.0
+    f[..., 0] = lab[..., 1] / 500.0 + f[..., 1]
+    f[..., 2] = f[..., 1] - lab[..., 2] / 200.0
+    cubed = f**3
+    xyz = numpy.where(cubed > CIE_E, cubed, (f - 16.0 / 116.0) / 7.787) * D65
+    linear = numpy.maximum(xyz @ XYZ_TO_SRGB.T, 0.0)
+    return numpy.where(
+        linear <= 0.0031308, linear * 12.92, 1.055 * linear ** (1 / 2.4) - 0.055
+    )
+
+
+def pack_srgb(srgb: numpy.ndarray) -> numpy.ndarray:
+    # clamps to the sRGB gamut and packs into 0xRRGGBB ints, like discord colors
+    upscaled = numpy.floor(0.5 + numpy.clip(srgb, 0.0, 1.0) * 255).astype(numpy.int64)
+    return (upscaled[..., 0] << 16) | (upscaled[..., 1] << 8) | upscaled[..., 2]
+
+
+def unpack_srgb(color: numpy.ndarray | int) -> numpy.ndarray:
+    color = numpy.asarray(color, dtype=numpy.int64)
+    rgb = numpy.stack([(color >> 16) & 255, (color >> 8) & 255, color & 255], -1)
+    return rgb / 255.0
@@ -0,0 +1,256 @@
+from __future__ import annotations
+import json
+import logging
+import trio
+from typing import Any, Awaitable, Callable, Optional
+from trio_websocket import (
+    ConnectionClosed,
+    HandshakeError,
+    WebSocketConnection,
+    connect_websocket_url,
+)
+
+from .twitch import HELIX_URL, TwitchClient, TwitchError
+
+log = logging.getLogger(__name__)
+
+EVENTSUB_URL = "wss://eventsub.wss.twitch.tv/ws"
+
+
+class EventSubError(Exception):
+    pass
+
+
+# (broadcaster user id, broadcaster login)
+StreamEvent = Callable[[str, str], Awaitable[None]]
+
+
+class EventSubClient:
+    # pushes stream.online and stream.offline for every linked stream over an
+    # eventsub websocket; twitch only allows websocket subscriptions with a user
+    # access token and a small total cost per connection, so streams it can't
+    # subscribe to are left to polling
+
+    TYPES = ("stream.online", "stream.offline")
+    KEEPALIVE_GRACE = 5  # seconds past twitch's keepalive timeout
+    SYNC_INTERVAL = 60  # seconds between checks for newly linked streams
+    MAX_BACKOFF = 300  # seconds between reconnect attempts
+    CONNECT_TIMEOUT = 5
+    DRAIN_TIMEOUT = 0.5  # seconds the old connection is read after a reconnect
+
+    def __init__(
+        self,
+        twitch: TwitchClient,
+        token: str,
+        on_online: StreamEvent,
+        on_offline: StreamEvent,
+        url: str = EVENTSUB_URL,
+    ):
+        self.twitch = twitch
+        self.token = token
+        self.on_online = on_online
+        self.on_offline = on_offline
+        self.url = url
+        self.session_id: Optional[str] = None
+        self.subscribed: set[str] = set()  # user ids
+        self.refused: set[str] = set()  # user ids twitch wouldn't subscribe to
+        self.on_disconnect: Optional[Callable[[], None]] = None
+        self.events = 0
+        self.reconnects = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.session_id is not None
+
+    def covers(self, user_ids: set[str]) -> bool:
+        # whether every one of user_ids gets pushed, so polling can slow down
+        return self.connected and bool(user_ids) and user_ids <= self.subscribed
+
+    async def run(self, get_user_ids: Callable[[], set[str]]):
+        delay = 1.0
+        try:
+            while True:
+                async with trio.open_nursery() as nursery:
+                    # the nursery holds the connections' reader tasks, so the
+                    # old connection can stay open while a reconnect is made
+                    started = await self.connect(nursery, get_user_ids)
+                    nursery.cancel_scope.cancel()
+                self.disconnected()
+                if started:
+                    delay = 1.0
+                await trio.sleep(delay)
+                delay = min(delay * 2, self.MAX_BACKOFF)
+        finally:
+            self.disconnected()
+
+    def disconnected(self):
+        self.session_id = None
+        self.subscribed.clear()
+        if self.on_disconnect:
+            self.on_disconnect()
+
+    async def connect(
+        self, nursery: trio.Nursery, get_user_ids: Callable[[], set[str]]
+    ) -> bool:
+        # runs connections until one is lost, following twitch's reconnects,
+        # returns whether a session was started at all
+        started = False
+        ws = None
+        try:
+            ws, session = await self.open(nursery, self.url)
+            # a new session starts from nothing and a fresh cost budget
+            self.subscribed.clear()
+            self.refused.clear()
+            while True:
+                started = True
+                self.session_id = session["id"]
+                log.info(f"EventSub session {self.session_id} started.")
+                url = await self.session(ws, session, get_user_ids)
+                # subscriptions only carry over when the new connection is
+                # welcomed while the old one is still open
+                new_ws, session = await self.open(nursery, url)
+                old, ws = ws, new_ws
+                try:
+                    await self.drain(old)
+                finally:
+                    await self.close(old)
+                self.reconnects += 1
+        except (
+            HandshakeError,
+            ConnectionClosed,
+            OSError,
+            EventSubError,
+            trio.TooSlowError,
+        ) as e:
+            log.warning(f"EventSub connection lost! {e!r}")
+        except Exception:
+            log.exception("EventSub connection failed!")
+        finally:
+            if ws:
+                await self.close(ws)
+        return started
+
+    async def open(
+        self, nursery: trio.Nursery, url: str
+    ) -> tuple[WebSocketConnection, dict[str, Any]]:
+        with trio.fail_after(self.CONNECT_TIMEOUT):
+            ws = await connect_websocket_url(nursery, url)
+        welcome = await self.receive(ws, 10)
+        if not welcome or welcome["metadata"]["message_type"] != "session_welcome":
+            await self.close(ws)
+            raise EventSubError("no welcome message")
+        return ws, welcome["payload"]["session"]
+
+    async def close(self, ws: WebSocketConnection):
+        with trio.move_on_after(self.CONNECT_TIMEOUT):
+            await ws.aclose()
+
+    async def drain(self, ws: WebSocketConnection):
+        # twitch keeps sending to the old connection until the new one is
+        # welcomed, handle what it sent in the meantime
+        try:
+            while message := await self.receive(ws, self.DRAIN_TIMEOUT):
+                await self.handle(message)
+        except ConnectionClosed:
+            pass
+
+    async def session(
+        self,
+        ws: WebSocketConnection,
+        session: dict[str, Any],
+        get_user_ids: Callable[[], set[str]],
+    ) -> str:
+        # runs one connection, returns the url to reconnect to when twitch
+        # asks for a reconnect
+        keepalive = session.get("keepalive_timeout_seconds") or 10
+        # twitch drops the session if nothing is subscribed within 10s
+        await self.sync(get_user_ids)
+        next_sync = trio.current_time() + self.SYNC_INTERVAL
+        while True:
+            message = await self.receive(ws, keepalive + self.KEEPALIVE_GRACE)
+            if message is None:
+                raise EventSubError("keepalive timed out")
+            reconnect_url = await self.handle(message)
+            if reconnect_url:
+                return reconnect_url
+            if trio.current_time() >= next_sync:
+                await self.sync(get_user_ids)
+                next_sync = trio.current_time() + self.SYNC_INTERVAL
+
+    async def receive(
+        self, ws: WebSocketConnection, timeout: float
+    ) -> Optional[dict[str, Any]]:
+        with trio.move_on_after(timeout):
+            return json.loads(await ws.get_message())
+        return None
+
+    async def handle(self, message: dict[str, Any]) -> Optional[str]:
+        try:
+            message_type = message["metadata"]["message_type"]
+            payload = message["payload"]
+            if message_type == "notification":
+                event = payload["event"]
+                user_id = event["broadcaster_user_id"]
+                login = event["broadcaster_user_login"]
+                kind = payload["subscription"]["type"]
+            elif message_type == "session_reconnect":
+                return payload["session"]["reconnect_url"]
+            elif message_type == "revocation":
+                condition = payload["subscription"]["condition"]
+                user_id = condition.get("broadcaster_user_id", "")
+        except (KeyError, TypeError) as e:
+            log.warning(f"Ignored malformed EventSub message! {e!r}")
+            return None
+        if message_type == "notification":
+            self.events += 1
+            log.info(f"EventSub {kind} for {login}.")
+            if kind == "stream.online":
+                await self.on_online(user_id, login)
+            elif kind == "stream.offline":
+                await self.on_offline(user_id, login)
+        elif message_type == "revocation":
+            log.info(f"EventSub subscription revoked: {condition}.")
+            self.subscribed.discard(user_id)
+        return None
+
+    async def sync(self, get_user_ids: Callable[[], set[str]]):
+        # subscribes to streams linked since the last sync
+        for user_id in get_user_ids() - self.subscribed - self.refused:
+            try:
+                await self.subscribe(user_id)
+            except TwitchError as e:
+                log.warning(f"EventSub subscription for {user_id} failed! {e}")
+                return
+
+    async def subscribe(self, user_id: str):
+        for kind in self.TYPES:
+            body = {
+                "type": kind,
+                "version": "1",
+                "condition": {"broadcaster_user_id": user_id},
+                "transport": {"method": "websocket", "session_id": self.session_id},
+            }
+            response = await self.twitch.request(
+                "POST",
+                f"{HELIX_URL}/eventsub/subscriptions",
+                json=body,
+                headers=self.twitch.headers(self.token),
+            )
+            # 409 means this session already has it
+            if response.status_code not in (202, 409):
+                log.info(
+                    f"Couldn't subscribe to {kind} for {user_id} "
+                    f"({response.status_code}), leaving it to polling."
+                )
+                self.refused.add(user_id)
+                return
+        self.subscribed.add(user_id)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "connected": self.connected,
+            "subscribed": len(self.subscribed),
+            "refused": len(self.refused),
+            "events": self.events,
+            "reconnects": self.reconnects,
+        }
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import io
+import logging
+import os
+import tempfile
+import time
+import cv2
+import numpy
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from PIL import Image
+
+log = logging.getLogger(__name__)
+
+# opencv 4.11+ can decode straight from a python stream, older versions need
+# a file, which goes to a private temp file in shared memory when available
+IN_MEMORY_DECODE = hasattr(cv2, "IStreamReader")
+TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+FORMAT_ALIASES = {"JPG": "JPEG", "TIF": "TIFF"}
+
+
+class FrameError(Exception):
+    pass
+
+
+@contextmanager
+def open_video(data: bytes | io.BufferedIOBase) -> Iterator[cv2.VideoCapture]:
+    # data is either a whole video or, with in memory decoding, a file-like
+    # object opencv reads from as it decodes
+    path = None
+    if IN_MEMORY_DECODE:
+        # opencv doesn't hold a reference, the stream must outlive the capture
+        stream = io.BytesIO(data) if isinstance(data, bytes) else data
+        capture = cv2.VideoCapture(stream, cv2.CAP_FFMPEG, [])
+    else:
+        fd, path = tempfile.mkstemp(suffix=".ts", dir=TEMP_DIR)
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        capture = cv2.VideoCapture(path)
+    try:
+        yield capture
+    finally:
+        capture.release()
+        if path:
+            os.remove(path)
+
+
+def decode_first_frame(data: bytes | io.BufferedIOBase) -> numpy.ndarray:
+    # first frame of a video segment as an rgb array; ffmpeg conceals errors
+    # in a truncated frame instead of failing, so it's only known to be whole
+    # once the frame after it decodes too
+    with open_video(data) as capture:
+        ok, frame = capture.read()
+        if not ok or frame is None:
+            raise FrameError("couldn't decode a frame")
+        if not capture.grab():
+            raise FrameError("first frame is incomplete")
+    # converted in place, so the frame is never copied
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+
+
+def decode_frames(
+    data: bytes, fps: float, max_frames: int, size: tuple[int, int]
+) -> Iterator[numpy.ndarray]:
+    # rgb frames sampled at fps and shrunk to fit size as they are decoded,
+    # so only one full resolution frame is in memory at a time
+    interval = 1000.0 / fps
+    next_at = None
+    count = 0
+    with open_video(data) as capture:
+        while count < max_frames:
+            ok, frame = capture.read()
+            if not ok or frame is None:
+                break
+            position = capture.get(cv2.CAP_PROP_POS_MSEC)
+            if next_at is None:
+                next_at = position
+            if position < next_at:
+                continue
+            next_at += interval
+            count += 1
+            height, width = frame.shape[:2]
+            scale = min(size[0] / width, size[1] / height, 1.0)
+            if scale < 1.0:
+                frame = cv2.resize(
+                    frame,
+                    (round(width * scale), round(height * scale)),
+                    interpolation=cv2.INTER_AREA,
+                )
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+
+
+def encode_animation(frames: list[numpy.ndarray], fps: float, format: str) -> bytes:
+    # animated gif or webp, frames are rgb arrays of the same size
+    if not frames:
+        raise FrameError("no frames to encode")
+    images = [Image.fromarray(frame) for frame in frames]
+    duration = round(1000 / fps)
+    buffer = io.BytesIO()
+    if format == "gif":
+        # one palette for every frame, built from a few of them, keeps colors
+        # from flickering and lets the encoder store only what changed
+        step = max(len(images) // 4, 1)
+        sample = numpy.concatenate(frames[::step], axis=0)
+        palette = Image.fromarray(sample).quantize(256)
+        images = [
+            image.quantize(palette=palette, dither=Image.Dither.NONE)
+            for image in images
+        ]
+        images[0].save(
+            buffer,
+            format="GIF",
+            save_all=True,
+            append_images=images[1:],
+            duration=duration,
+            loop=0,
+            optimize=True,
+        )
+    else:
+        images[0].save(
+            buffer,
+            format="WEBP",
+            save_all=True,
+            append_images=images[1:],
+            duration=duration,
+            loop=0,
+            quality=60,
+            method=4,
+        )
+    return buffer.getvalue()
+
+
+def encode_jpeg(
+    frame: numpy.ndarray, size: Optional[tuple[int, int]] = None, quality: int = 90
+) -> bytes:
+    height, width = frame.shape[:2]
+    # wraps the array's memory instead of copying it into the image
+    img = Image.frombuffer("RGB", (width, height), frame, "raw", "RGB", 0, 1)
+    if size:
+        img.thumbnail(size, reducing_gap=2.0)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class ImageProfile:
+    # how an image is encoded for upload: fit inside max_size, then encode at
+    # quality, stepping the quality down until it fits in max_bytes
+
+    QUALITY_STEP = 10
+
+    def __init__(
+        self,
+        max_size: Optional[tuple[int, int]] = None,
+        quality: int = 85,
+        format: str = "JPEG",
+        max_bytes: Optional[int] = None,
+        min_quality: int = 50,
+    ):
+        self.max_size = max_size
+        self.quality = quality
+        format = format.upper()
+        self.format = FORMAT_ALIASES.get(format, format)
+        # checked up front, pillow only complains about a format when saving
+        Image.init()
+        if self.format not in Image.SAVE:
+            raise ValueError(f"can't encode {format} images")
+        self.max_bytes = max_bytes
+        self.min_quality = min_quality
+
+    def __repr__(self):
+        return (
+            f"ImageProfile({self.max_size}, {self.quality}, '{self.format}', "
+            f"{self.max_bytes})"
+        )
+
+    @property
+    def extension(self) -> str:
+        return "jpg" if self.format == "JPEG" else self.format.lower()
+
+    def save(self, img: Image.Image, quality: int) -> bytes:
+        buffer = io.BytesIO()
+        if self.format == "JPEG":
+            img.save(
+                buffer, format="JPEG", quality=quality, optimize=True, progressive=True
+            )
+        else:
+            img.save(buffer, format=self.format, quality=quality, method=4)
+        return buffer.getvalue()
+
+    def encode(self, img: Image.Image) -> bytes:
+        if self.max_size:
+            # reducing_gap resizes in two cheap steps instead of one slow one
+            img.thumbnail(self.max_size, reducing_gap=2.0)
+        quality = self.quality
+        data = self.save(img, quality)
+        while self.max_bytes and len(data) > self.max_bytes:
+            if quality - self.QUALITY_STEP < self.min_quality:
+                break
+            quality -= self.QUALITY_STEP
+            data = self.save(img, quality)
+        return data
+
+
+def render_jpeg(jpeg: bytes, profile: ImageProfile) -> tuple[bytes, dict[str, float]]:
+    # jpeg re-encoded with profile, plus how long it took
+    start = time.perf_counter()
+    img = Image.open(io.BytesIO(jpeg))
+    if profile.max_size:
+        # lets the jpeg decoder scale down by a power of two while decoding
+        img.draft("RGB", profile.max_size)
+    img = img.convert("RGB")
+    decoded = time.perf_counter()
+    data = profile.encode(img)
+    encoded = time.perf_counter()
+    timings = {"decode": decoded - start, "encode": encoded - decoded}
+    return data, timings
@@ -0,0 +1,47 @@
+from __future__ import annotations
+import logging
+import random
+import numpy
+from colormath.color_diff_matrix import delta_e_cie2000
+
+from .colorspace import hex_to_rgb, lab_to_srgb, pack_srgb, srgb_to_lab, unpack_srgb
+
+log = logging.getLogger(__name__)
+
+MIN_LIGHTNESS = 40  # random rainbow colors darker than this are rejected
+SAMPLE_SIZE = 32  # random colors converted per rejection sampling round
+EASTER_EGG = hex_to_rgb("#36393F")  # discord background, 1 in 200 gradients
+
+rng = numpy.random.default_rng()
+
+
+def lab_gradient(lab1: numpy.ndarray, lab2: numpy.ndarray, steps: int) -> numpy.ndarray:
+    # (steps, 3) Lab colors stepping from just after lab1 up to lab2
+    fractions = numpy.arange(1, steps + 1)[:, numpy.newaxis] / steps
+    return lab1 + (lab2 - lab1) * fractions
+
+
+def random_lab(
+    min_lightness: float = MIN_LIGHTNESS,
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    # random (srgb, lab) pair with lightness above min_lightness
+    while True:
+        srgb = rng.random((SAMPLE_SIZE, 3))
+        lab = srgb_to_lab(srgb)
+        valid = numpy.flatnonzero(lab[:, 0] > min_lightness)
+        if len(valid):
+            return srgb[valid[0]], lab[valid[0]]
+
+
+def next_gradient(current_color: int) -> list[int]:
+    # packed role colors fading from current_color to a new random color,
+    # one step per unit of delta e (cie 2000) between them
+    current_lab = srgb_to_lab(unpack_srgb(current_color))
+    if random.choice(range(200)) == 69:
+        next_lab = srgb_to_lab(numpy.array(EASTER_EGG) / 255.0)
+    else:
+        _, next_lab = random_lab()
+    delta_e = float(delta_e_cie2000(current_lab, next_lab[numpy.newaxis, :])[0])
+    steps = int(max(delta_e, 1))
+    gradient = pack_srgb(lab_to_srgb(lab_gradient(current_lab, next_lab, steps)))
+    return gradient.tolist()
@@ -0,0 +1,130 @@
+from __future__ import annotations
+import heapq
+import logging
+import numpy
+
+log = logging.getLogger(__name__)
+
+
+class LabTree:
+    # k-d tree over Lab coordinates, stored as flat arrays so it can be
+    # written to and read from a single .npz file
+
+    LEAF_SIZE = 16
+
+    def __init__(
+        self,
+        order: numpy.ndarray,
+        data: numpy.ndarray,
+        start: numpy.ndarray,
+        end: numpy.ndarray,
+        dim: numpy.ndarray,
+        value: numpy.ndarray,
+        left: numpy.ndarray,
+        right: numpy.ndarray,
+    ):
+        self.order = order  # tree position -> point index
+        self.data = data  # points in tree order
+        self.start = start  # per node: range of tree positions it covers
+        self.end = end
+        self.dim = dim  # split dimension, -1 for leaves
+        self.value = value  # split value
+        self.left = left
+        self.right = right
+        # python lists are much faster than numpy scalars inside the query loop
+        self._order: list[int] = order.tolist()
+        self._nodes = list(
+            zip(
+                start.tolist(),
+                end.tolist(),
+                dim.tolist(),
+                value.tolist(),
+                left.tolist(),
+                right.tolist(),
+            )
+        )
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    @classmethod
+    def build(cls, points: numpy.ndarray) -> LabTree:
+        points = numpy.asarray(points, dtype=numpy.float64)
+        order = numpy.arange(len(points))
+        nodes: list[list] = []
+
+        def split(lo: int, hi: int) -> int:
+            node = len(nodes)
+            nodes.append([lo, hi, -1, 0.0, -1, -1])
+            if hi - lo <= cls.LEAF_SIZE:
+                return node
+            chunk = points[order[lo:hi]]
+            dim = int(numpy.argmax(chunk.max(axis=0) - chunk.min(axis=0)))
+            # stable sort keeps equal points in palette order
+            order[lo:hi] = order[lo:hi][numpy.argsort(chunk[:, dim], kind="stable")]
+            mid = (lo + hi) // 2
+            nodes[node][2] = dim
+            nodes[node][3] = float(points[order[mid], dim])
+            nodes[node][4] = split(lo, mid)
+            nodes[node][5] = split(mid, hi)
+            return node
+
+        split(0, len(points))
+        start, end, dim, value, left, right = zip(*nodes)
+        return cls(
+            order,
+            points[order],
+            numpy.array(start, dtype=numpy.int32),
+            numpy.array(end, dtype=numpy.int32),
+            numpy.array(dim, dtype=numpy.int8),
+            numpy.array(value, dtype=numpy.float64),
+            numpy.array(left, dtype=numpy.int32),
+            numpy.array(right, dtype=numpy.int32),
+        )
+
+    def save(self, path: str):
+        numpy.savez(
+            path,
+            order=self.order,
+            data=self.data,
+            start=self.start,
+            end=self.end,
+            dim=self.dim,
+            value=self.value,
+            left=self.left,
+            right=self.right,
+        )
+        log.debug(f"Saved color tree ({len(self)} points) to {path}.")
+
+    @classmethod
+    def load(cls, path: str) -> LabTree:
+        with numpy.load(path) as arrays:
+            tree = cls(**{key: arrays[key] for key in arrays.files})
+        log.debug(f"Loaded color tree ({len(tree)} points) from {path}.")
+        return tree
+
+    def query(self, point: numpy.ndarray, k: int = 1) -> list[int]:
+        # indices of the k nearest points (euclidean / cie 1976), closest first
+        q = tuple(float(v) for v in point)
+        best: list[tuple[float, int]] = []  # max-heap of (-distance², -index)
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if len(best) == k and bound > -best[0][0]:
+                continue
+            lo, hi, dim, value, left, right = self._nodes[node]
+            if dim < 0:
+                d2 = numpy.sum((self.data[lo:hi] - point) ** 2, axis=1).tolist()
+                for i, d in enumerate(d2):
+                    item = (-d, -self._order[lo + i])
+                    if len(best) < k:
+                        heapq.heappush(best, item)
+                    elif item > best[0]:
+                        heapq.heapreplace(best, item)
+                continue
+            diff = q[dim] - value
+            near, far = (left, right) if diff < 0 else (right, left)
+            stack.append((far, diff * diff))
+            stack.append((near, 0.0))
+        best.sort(reverse=True)
+        return [-index for _, index in best]
@@ -0,0 +1,132 @@
+from __future__ import annotations
+import bisect
+import difflib
+import logging
+import numpy
+from collections import defaultdict
+from typing import Optional, Sequence
+
+from .palette import get_palette
+
+log = logging.getLogger(__name__)
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    # exact lookups go through a case-folded dict, fuzzy lookups narrow the
+    # palette down with a trigram index before running difflib on the shortlist,
+    # and autocomplete bisects sorted name and word prefixes
+
+    CANDIDATES = 32  # names scored with difflib after trigram filtering
+
+    def __init__(self, names: Sequence[str]):
+        self.names = names
+        self.keys: list[str] = [name.lower() for name in names]
+        self.exact_index: dict[str, int] = {}
+        postings: dict[str, list[int]] = defaultdict(list)
+        gram_counts = numpy.empty(len(self.keys), dtype=numpy.int32)
+        for index, key in enumerate(self.keys):
+            self.exact_index.setdefault(key.casefold(), index)
+            grams = trigrams(key)
+            gram_counts[index] = len(grams)
+            for gram in grams:
+                postings[gram].append(index)
+        self.postings: dict[str, numpy.ndarray] = {
+            gram: numpy.array(indices, dtype=numpy.int32)
+            for gram, indices in postings.items()
+        }
+        self.gram_counts = gram_counts
+        names_sorted = sorted((key, index) for index, key in enumerate(self.keys))
+        words_sorted = sorted(
+            (key[i + 1 :], index)
+            for index, key in enumerate(self.keys)
+            for i, char in enumerate(key)
+            if char == " "
+        )
+        self.name_prefixes = [key for key, _ in names_sorted]
+        self.name_ids = [index for _, index in names_sorted]
+        self.word_prefixes = [key for key, _ in words_sorted]
+        self.word_ids = [index for _, index in words_sorted]
+        log.info(
+            f"Indexed {len(self.keys)} color names ({len(self.postings)} trigrams)."
+        )
+
+    def exact(self, name: str) -> Optional[int]:
+        return self.exact_index.get(name.casefold())
+
+    def fuzzy(self, name: str) -> int:
+        # best difflib ratio among the names sharing the most trigrams with name
+        key = name.lower()
+        grams = trigrams(key)
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists:
+            return self.scan(key)
+        hits, shared = numpy.unique(numpy.concatenate(lists), return_counts=True)
+        dice = shared / (self.gram_counts[hits] + len(grams))
+        if len(hits) > self.CANDIDATES:
+            top = numpy.argpartition(-dice, self.CANDIDATES - 1)[: self.CANDIDATES]
+            hits, dice = hits[top], dice[top]
+        # most similar names first, so the ratio upper bounds can prune the rest
+        matcher = difflib.SequenceMatcher(None, key)
+        best = (0.0, 0)
+        for index in hits[numpy.argsort(-dice, kind="stable")].tolist():
+            candidate = self.keys[index]
+            total = len(key) + len(candidate)
+            if 2.0 * min(len(key), len(candidate)) / total < best[0]:
+                continue
+            matcher.set_seq2(candidate)
+            if matcher.quick_ratio() < best[0]:
+                continue
+            ratio = matcher.ratio()
+            # ties go to the earliest name, like a scan in palette order
+            if ratio > best[0] or (ratio == best[0] and index < best[1]):
+                best = (ratio, index)
+        return best[1]
+
+    def scan(self, key: str) -> int:
+        # full difflib pass, only used when no trigram matches at all
+        best = (0.0, 0)
+        for index, candidate in enumerate(self.keys):
+            ratio = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if ratio > best[0]:
+                best = (ratio, index)
+        return best[1]
+
+    def complete(self, prefix: str, limit: int = 25) -> list[int]:
+        # names starting with prefix, then names with a later word starting with it
+        prefix = prefix.lower().strip()
+        if not prefix:
+            return []
+        found: dict[str, int] = {}  # keyed by name, the palette has duplicates
+        for keys, ids in (
+            (self.name_prefixes, self.name_ids),
+            (self.word_prefixes, self.word_ids),
+        ):
+            position = bisect.bisect_left(keys, prefix)
+            while position < len(keys) and len(found) < limit:
+                if not keys[position].startswith(prefix):
+                    break
+                found.setdefault(self.keys[ids[position]], ids[position])
+                position += 1
+        return list(found.values())
+
+    def search(self, name: str) -> tuple[int, bool]:
+        # returns (palette index, whether the name matched exactly)
+        index = self.exact(name)
+        if index is not None:
+            return index, True
+        return self.fuzzy(name), False
+
+
+_name_index: Optional[NameIndex] = None
+
+
+def get_name_index() -> NameIndex:
+    global _name_index
+    if _name_index is None:
+        _name_index = NameIndex(get_palette().names)
+    return _name_index
@@ -0,0 +1,243 @@
+from __future__ import annotations
+import json
+import logging
+import os
+import struct
+import numpy
+from typing import Iterator, Optional, Sequence
+from colormath.color_diff_matrix import delta_e_cie2000
+from colormath.color_objects import sRGBColor
+
+from .colorspace import hex_to_rgb, srgb_to_lab, unpack_srgb
+from .kdtree import LabTree
+
+log = logging.getLogger(__name__)
+
+COLORNAMES_PATH = "colornames.json"
+COLORTREE_PATH = "./appdata/colortree.npz"
+PALETTE_PATH = "./appdata/colornames.bin"
+
+# binary palette layout (little endian, sections aligned to 8 bytes):
+#   header   magic, color count, name blob size
+#   rgb      uint8[count][3]
+#   lab      float64[count][3]
+#   offsets  uint32[count + 1], name i is blob[offsets[i]:offsets[i + 1]]
+#   blob     utf-8 encoded names
+PALETTE_MAGIC = b"MUMPAL01"
+PALETTE_HEADER = struct.Struct("<8sII")
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def _sections(count: int) -> tuple[int, int, int, int]:
+    rgb = PALETTE_HEADER.size
+    lab = _align(rgb + 3 * count)
+    offsets = lab + 24 * count
+    blob = _align(offsets + 4 * (count + 1))
+    return rgb, lab, offsets, blob
+
+
+class NameTable(Sequence[str]):
+    # read-only list of names decoded on access from an offset-indexed blob
+
+    def __init__(self, offsets: numpy.ndarray, blob: numpy.ndarray):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("name index out of range")
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        data = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode("utf-8")
+
+
+def build_binary_palette(
+    json_path: str = COLORNAMES_PATH, bin_path: str = PALETTE_PATH
+):
+    palette = Palette.from_json(json_path)
+    encoded = [name.encode("utf-8") for name in palette.names]
+    offsets = numpy.zeros(len(encoded) + 1, dtype="<u4")
+    offsets[1:] = numpy.cumsum([len(name) for name in encoded])
+    blob = b"".join(encoded)
+    rgb_at, lab_at, offsets_at, blob_at = _sections(len(palette))
+    tmp_path = f"{bin_path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(PALETTE_HEADER.pack(PALETTE_MAGIC, len(palette), len(blob)))
+        for at, data in (
+            (rgb_at, palette.rgb.astype(numpy.uint8).tobytes()),
+            (lab_at, palette.lab.astype("<f8").tobytes()),
+            (offsets_at, offsets.tobytes()),
+            (blob_at, blob),
+        ):
+            file.write(b"\0" * (at - file.tell()))
+            file.write(data)
+    os.replace(tmp_path, bin_path)
+    log.info(f"Wrote binary palette ({len(palette)} colors) to {bin_path}.")
+
+
+class Palette:
+    # keeps the whole named palette in memory as numpy arrays so that
+    # nearest-name lookups are a single vectorized distance computation
+
+    CHUNK_SIZE = 64  # query colors compared per batch, bounds memory use
+    CANDIDATES = 16  # cie 1976 neighbours re-ranked with cie 2000
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        rgb: numpy.ndarray,
+        lab: Optional[numpy.ndarray] = None,
+    ):
+        self.names = names
+        self.rgb: numpy.ndarray = rgb  # (n, 3) uint8
+        if lab is None:
+            lab = srgb_to_lab(rgb / 255.0)
+        self.lab: numpy.ndarray = lab  # (n, 3) float64
+        self._tree: Optional[LabTree] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @classmethod
+    def from_json(cls, path: str = COLORNAMES_PATH) -> Palette:
+        with open(path, encoding="utf-8") as colornames:
+            colornames = json.loads(colornames.read())
+        names = [color["name"] for color in colornames]
+        rgb = numpy.array(
+            [hex_to_rgb(color["hex"]) for color in colornames], dtype=numpy.uint8
+        )
+        log.info(f"Loaded {len(names)} colors from {path}.")
+        return cls(names, rgb)
+
+    @classmethod
+    def from_binary(cls, path: str = PALETTE_PATH) -> Palette:
+        # arrays are read-only views into the mapped file, nothing is parsed
+        buffer = numpy.memmap(path, dtype=numpy.uint8, mode="r")
+        magic, count, blob_size = PALETTE_HEADER.unpack_from(buffer)
+        if magic != PALETTE_MAGIC:
+            raise ValueError(f"{path} is not a binary palette")
+        rgb_at, lab_at, offsets_at, blob_at = _sections(count)
+        rgb = buffer[rgb_at : rgb_at + 3 * count].reshape(count, 3)
+        lab = buffer[lab_at : lab_at + 24 * count].view("<f8").reshape(count, 3)
+        offsets = buffer[offsets_at : offsets_at + 4 * (count + 1)].view("<u4")
+        blob = buffer[blob_at : blob_at + blob_size]
+        log.info(f"Mapped {count} colors from {path}.")
+        return cls(NameTable(offsets, blob), rgb, lab)
+
+    def hex(self, index: int) -> str:
+        r, g, b = self.rgb[index]
+        return f"#{r:02x}{g:02x}{b:02x}"
+
+    def nearest(self, lab: numpy.ndarray) -> int:
+        # index of the palette color with the lowest delta e (cie 1976)
+        delta_e = numpy.sqrt(numpy.sum((self.lab - lab) ** 2, axis=1))
+        return int(numpy.argmin(delta_e))
+
+    def nearest_many(self, labs: numpy.ndarray) -> numpy.ndarray:
+        labs = numpy.asarray(labs, dtype=numpy.float64).reshape(-1, 3)
+        result = numpy.empty(len(labs), dtype=numpy.intp)
+        for start in range(0, len(labs), self.CHUNK_SIZE):
+            chunk = labs[start : start + self.CHUNK_SIZE]
+            diff = self.lab[numpy.newaxis, :, :] - chunk[:, numpy.newaxis, :]
+            delta_e = numpy.sqrt(numpy.sum(diff**2, axis=2))
+            result[start : start + len(chunk)] = numpy.argmin(delta_e, axis=1)
+        return result
+
+    @property
+    def tree(self) -> LabTree:
+        if self._tree is None:
+            self._tree = self.load_tree()
+        return self._tree
+
+    def load_tree(self, path: str = COLORTREE_PATH) -> LabTree:
+        # reuse the tree saved by a previous run if it still matches the palette
+        if os.path.exists(path):
+            try:
+                tree = LabTree.load(path)
+                if len(tree) == len(self) and numpy.array_equal(
+                    tree.data, self.lab[tree.order]
+                ):
+                    return tree
+                log.info("Saved color tree doesn't match palette, rebuilding.")
+            except Exception as e:
+                log.warning(f"Couldn't load color tree! {e}")
+        tree = LabTree.build(self.lab)
+        log.info(f"Built color tree for {len(self)} colors.")
+        try:
+            tree.save(path)
+        except OSError as e:
+            log.warning(f"Couldn't save color tree! {e}")
+        return tree
+
+    def best_match(self, lab: numpy.ndarray) -> int:
+        # closest cie 1976 candidates from the tree, re-ranked by delta e (cie 2000)
+        candidates = self.tree.query(lab, self.CANDIDATES)
+        delta_e = delta_e_cie2000(lab, self.lab[candidates])
+        return candidates[int(numpy.argmin(delta_e))]
+
+    def name_srgb(self, srgb_color: sRGBColor) -> str:
+        lab = srgb_to_lab(numpy.array(srgb_color.get_value_tuple()))
+        return self.names[self.best_match(lab)]
+
+    def name_srgb_many(self, srgb_colors: list[sRGBColor]) -> list[str]:
+        values = [c.get_value_tuple() for c in srgb_colors]
+        labs = srgb_to_lab(numpy.array(values, dtype=numpy.float64).reshape(-1, 3))
+        return [self.names[self.best_match(lab)] for lab in labs]
+
+    def name_packed(self, colors: list[int], metric: str = "cie2000") -> list[str]:
+        # names for 0xRRGGBB ints, like discord role colors; "cie76" names the
+        # whole batch with one brute force distance computation instead of a
+        # tree query and re-rank per color
+        labs = srgb_to_lab(unpack_srgb(colors).reshape(-1, 3))
+        if metric == "cie76":
+            return [self.names[i] for i in self.nearest_many(labs)]
+        if metric != "cie2000":
+            raise ValueError(f"unknown color metric {metric}")
+        return [self.names[self.best_match(lab)] for lab in labs]
+
+
+_palette: Optional[Palette] = None
+
+
+def get_palette() -> Palette:
+    # palette is parsed once and shared by everything that needs color names
+    global _palette
+    if _palette is None:
+        _palette = load_palette()
+    return _palette
+
+
+def load_palette(
+    json_path: str = COLORNAMES_PATH, bin_path: str = PALETTE_PATH
+) -> Palette:
+    # (re)build the binary palette when colornames.json is newer than it
+    try:
+        if not os.path.exists(bin_path) or os.path.getmtime(
+            bin_path
+        ) < os.path.getmtime(json_path):
+            build_binary_palette(json_path, bin_path)
+        return Palette.from_binary(bin_path)
+    except (OSError, ValueError, struct.error) as e:
+        log.warning(f"Couldn't use binary palette! {e}")
+        return Palette.from_json(json_path)
+
+
+if __name__ == "__main__":
+    # build step: python -m utils.palette
+    logging.basicConfig(level=logging.INFO)
+    build_binary_palette()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+import logging
+import math
+import trio
+from typing import Any
+
+from .twitch import HELIX_BATCH_SIZE, RateLimit
+
+log = logging.getLogger(__name__)
+
+
+class PollScheduler:
+    # picks the time between live polls from the helix rate limit: as fast as
+    # the bucket refills for the number of requests a poll takes, and waiting
+    # out the reset when the bucket gets low instead of running into 429s;
+    # when eventsub covers every stream polling only reconciles, slowly
+
+    INTERVAL = 5  # seconds, used until twitch has reported a rate limit
+    MIN_INTERVAL = 2
+    MAX_INTERVAL = 60
+    FALLBACK_INTERVAL = 120  # seconds, while eventsub pushes every stream
+    BUDGET_SHARE = 0.5  # of the refill rate, the rest is left for other calls
+    RESERVE = 0.2  # of the bucket, polling waits for the reset below this
+
+    def __init__(self, rate_limit: RateLimit):
+        self.rate_limit = rate_limit
+        self.requests = 1  # helix requests the next poll will make
+        self.interval = float(self.INTERVAL)
+        self.ticks = 0
+        self.failed = 0
+        self.deferred = 0  # ticks that waited for the bucket to reset
+        self.duration = 0.0  # seconds the last poll took
+        self.fallback = False  # only reconciling, eventsub reports changes
+        self.woken = trio.Event()
+
+    def set_lookups(self, user_ids: int, logins: int = 0):
+        # ids and logins go in separate requests, 100 per request
+        requests = math.ceil(user_ids / HELIX_BATCH_SIZE)
+        requests += math.ceil(logins / HELIX_BATCH_SIZE)
+        self.requests = max(requests, 1)
+
+    def next_interval(self) -> float:
+        limit, remaining = self.rate_limit.limit, self.rate_limit.remaining
+        if limit is None or remaining is None:
+            return float(self.INTERVAL)
+        # the bucket refills limit points per minute
+        refill = limit / 60 * self.BUDGET_SHARE
+        interval = self.requests / refill if refill else float(self.MAX_INTERVAL)
+        if remaining - self.requests < limit * self.RESERVE:
+            self.deferred += 1
+            interval = max(interval, self.rate_limit.reset_in())
+            log.info(
+                f"Helix budget low ({remaining}/{limit}), polling in {interval:.0f}s."
+            )
+        return float(min(max(interval, self.MIN_INTERVAL), self.MAX_INTERVAL))
+
+    async def wait(self):
+        self.interval = self.next_interval()
+        if self.fallback:
+            self.interval = max(self.interval, float(self.FALLBACK_INTERVAL))
+        with trio.move_on_after(self.interval):
+            await self.woken.wait()
+        self.woken = trio.Event()
+
+    def wake(self):
+        # polls right away, e.g. when eventsub drops and polling has to take over
+        self.woken.set()
+
+    def record(self, success: bool, duration: float):
+        self.ticks += 1
+        self.duration = duration
+        if not success:
+            self.failed += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "ticks": self.ticks,
+            "failed": self.failed,
+            "deferred": self.deferred,
+            "interval": self.interval,
+            "fallback": self.fallback,
+            "requests": self.requests,
+            "last_poll": self.duration,
+            "remaining": self.rate_limit.remaining,
+            "limit": self.rate_limit.limit,
+            "throttled": self.rate_limit.throttled,
+        }
@@ -50,6 +50,20 @@ def create_guilds_table(con: sqlite3.Connection):
     log.debug("Created Guilds table.")
 
 
+def create_twitchusers_table(con: sqlite3.Connection):
+    con.execute(
+        """
+    CREATE TABLE IF NOT EXISTS TwitchUsers (
+        Login TEXT PRIMARY KEY,
+        TwitchUserID TEXT,
+        ResolvedAt REAL
+    )
+    """
+    )
+    con.commit()
+    log.debug("Created TwitchUsers table.")
+
+
 def get_streams_by_userid(con: sqlite3.Connection, user_id: str) -> list[Stream]:
     query = "SELECT Stream FROM UserStreams WHERE UserID = ?"
     streams: list[Stream] = [s[0] for s in list(con.execute(query, (user_id,)))]
@@ -168,3 +182,37 @@ def delete_stream(con: sqlite3.Connection, stream: Stream):
     con.execute("DELETE FROM UserStreams WHERE Stream = ?", (stream,))
     con.commit()
     log.debug("Executed delete stream query.")
+
+
+def update_stream(con: sqlite3.Connection, old: Stream, new: Stream):
+    con.execute("UPDATE UserStreams SET Stream = ? WHERE Stream = ?", (new, old))
+    con.commit()
+    log.debug("Executed update stream query.")
+
+
+def get_twitch_userids(
+    con: sqlite3.Connection, logins: list[str]
+) -> dict[str, tuple[str, float]]:
+    # login -> (twitch user id, unix time it was resolved), "" for no such user
+    query = (
+        "SELECT Login, TwitchUserID, ResolvedAt FROM TwitchUsers "
+        "WHERE Login IN ({})".format(",".join("?" for _ in logins))
+    )
+    result = {
+        login: (userid, resolved_at)
+        for login, userid, resolved_at in con.execute(query, logins)
+    }
+    log.debug("Executed get twitch userids query.")
+    return result
+
+
+def insert_twitch_userids(
+    con: sqlite3.Connection, userids: dict[str, str], resolved_at: float
+):
+    con.executemany(
+        "INSERT OR REPLACE INTO TwitchUsers (Login, TwitchUserID, ResolvedAt) "
+        "VALUES (?, ?, ?)",
+        [(login, userid, resolved_at) for login, userid in userids.items()],
+    )
+    con.commit()
+    log.debug("Executed insert twitch userids query.")
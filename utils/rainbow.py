@@ -0,0 +1,94 @@
+from __future__ import annotations
+import logging
+import time
+import trio
+import httpx
+from typing import Awaitable, Callable, Optional
+
+from .gradient import next_gradient
+
+log = logging.getLogger(__name__)
+
+# (guild id, role id, current role color)
+RainbowTarget = tuple[str, str, int]
+RoleUpdater = Callable[[str, str, int], Awaitable[Optional[httpx.Response]]]
+
+
+class RainbowScheduler:
+    # keeps a separate gradient per guild and spreads each round of role
+    # updates evenly over the interval instead of sending them all at once
+
+    INTERVAL = 90  # seconds between color steps for each guild
+    MAX_BACKOFF = 900  # seconds, cap for repeated 429s
+
+    def __init__(
+        self,
+        update_role: RoleUpdater,
+        on_gradient: Optional[Callable[[list[int]], None]] = None,
+    ):
+        self.update_role = update_role
+        self.on_gradient = on_gradient  # sees every new gradient, e.g. to pre-name it
+        self.gradients: dict[str, list[int]] = {}
+        # time.monotonic() deadlines, trio's clock starts over with each run
+        self.retry_at: dict[str, float] = {}
+        self.strikes: dict[str, int] = {}
+
+    def next_color(self, guild_id: str, current_color: int) -> int:
+        gradient = self.gradients.get(guild_id)
+        if not gradient:
+            gradient = self.gradients[guild_id] = next_gradient(current_color)
+            log.debug(
+                f"New gradient for guild {guild_id}: {[f'#{c:06x}' for c in gradient]}"
+            )
+            if self.on_gradient:
+                self.on_gradient(gradient)
+        return gradient.pop(0)
+
+    def forget(self, guild_ids: set[str]):
+        # drop state for guilds that no longer have a rainbow role
+        for guild_id in list(self.gradients):
+            if guild_id not in guild_ids:
+                del self.gradients[guild_id]
+                self.retry_at.pop(guild_id, None)
+                self.strikes.pop(guild_id, None)
+
+    async def run(self, get_targets: Callable[[], list[RainbowTarget]]):
+        while True:
+            start = trio.current_time()
+            targets = get_targets()
+            self.forget({guild_id for guild_id, _, _ in targets})
+            spacing = self.INTERVAL / len(targets) if targets else 0
+            async with trio.open_nursery() as nursery:
+                for i, target in enumerate(targets):
+                    nursery.start_soon(self.step, *target, start + i * spacing)
+            await trio.sleep_until(start + self.INTERVAL)
+
+    async def step(
+        self, guild_id: str, role_id: str, current_color: int, deadline: float
+    ):
+        await trio.sleep_until(deadline)
+        if time.monotonic() < self.retry_at.get(guild_id, 0):
+            log.debug(f"Skipping rainbow update for guild {guild_id}, backing off.")
+            return
+        color = self.next_color(guild_id, current_color)
+        log.debug(f"next color for guild {guild_id}: #{color:06x}")
+        response = await self.update_role(guild_id, role_id, color)
+        if response is not None and response.status_code == 429:
+            self.gradients[guild_id].insert(0, color)
+            self.back_off(guild_id, response)
+        elif response is not None and response.is_success:
+            self.strikes.pop(guild_id, None)
+
+    def back_off(self, guild_id: str, response: httpx.Response):
+        strikes = self.strikes.get(guild_id, 0) + 1
+        self.strikes[guild_id] = strikes
+        try:
+            retry_after = float(response.json()["retry_after"])
+        except Exception:
+            retry_after = float(response.headers.get("Retry-After", self.INTERVAL))
+        delay = min(retry_after * 2 ** (strikes - 1), self.MAX_BACKOFF)
+        self.retry_at[guild_id] = time.monotonic() + delay
+        log.warning(
+            f"Rainbow role update rate limited in guild {guild_id}, "
+            f"backing off for {delay:.0f} seconds."
+        )
@@ -0,0 +1,87 @@
+from __future__ import annotations
+import logging
+import sqlite3
+import time
+from typing import Any, Optional
+
+from .queries import get_twitch_userids, insert_twitch_userids
+from .twitch import HELIX_BATCH_SIZE, TwitchClient, TwitchError, get_twitch_client
+
+log = logging.getLogger(__name__)
+
+
+class UserIdResolver:
+    # twitch login -> user id, remembered in sqlite so linking the same
+    # stream again or revalidating stored streams doesn't ask helix; logins
+    # that aren't cached are looked up 100 per request
+
+    TTL = 7 * 24 * 3600  # seconds before a resolved id is looked up again
+    MISSING_TTL = 3600  # same, for logins twitch didn't know
+
+    def __init__(
+        self,
+        con: sqlite3.Connection,
+        twitch: Optional[TwitchClient] = None,
+        ttl: float = TTL,
+    ):
+        self.con = con
+        self.twitch = twitch or get_twitch_client()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    async def resolve(self, login: str) -> str:
+        # user id for login, "" if twitch doesn't know it
+        return (await self.resolve_many([login])).get(login.lower(), "")
+
+    async def resolve_many(self, logins: list[str]) -> dict[str, str]:
+        # user ids keyed by lowercase login, logins twitch doesn't know map
+        # to "", logins that couldn't be looked up are left out
+        logins = sorted({login.lower() for login in logins if login})
+        if not logins:
+            return {}
+        now = time.time()
+        cached = get_twitch_userids(self.con, logins)
+        userids: dict[str, str] = {}
+        missing = []
+        for login in logins:
+            if login in cached:
+                userid, resolved_at = cached[login]
+                ttl = self.ttl if userid else self.MISSING_TTL
+                if now - resolved_at < ttl:
+                    userids[login] = userid
+                    continue
+            missing.append(login)
+        self.hits += len(userids)
+        self.misses += len(missing)
+        for i in range(0, len(missing), HELIX_BATCH_SIZE):
+            chunk = missing[i : i + HELIX_BATCH_SIZE]
+            try:
+                users = await self.twitch.get_users(chunk)
+                self.requests += 1
+            except TwitchError as e:
+                log.info(f"Couldn't resolve {len(chunk)} twitch logins! {e}")
+                # an expired id is better than none
+                for login in chunk:
+                    if login in cached and cached[login][0]:
+                        userids[login] = cached[login][0]
+                continue
+            found = dict.fromkeys(chunk, "")
+            found.update({user["login"].lower(): user["id"] for user in users})
+            insert_twitch_userids(self.con, found, now)
+            userids.update(found)
+        return userids
+
+    def remember(self, login: str, user_id: str):
+        # e.g. a rename seen in a stream response
+        insert_twitch_userids(self.con, {login.lower(): user_id}, time.time())
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "requests": self.requests,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
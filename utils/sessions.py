@@ -0,0 +1,72 @@
+from __future__ import annotations
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator
+from streamlink.options import Options
+from streamlink.session import Streamlink
+
+from .cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+
+class SessionPool:
+    # long-lived streamlink sessions shared by capture threads, plus a short
+    # cache of resolved streams so repeat captures skip playlist resolution
+
+    RESOLVE_TTL = 60  # seconds a resolved stream is reused for
+
+    def __init__(self, size: int, resolve_ttl: float = RESOLVE_TTL):
+        self.size = size
+        self.sessions: queue.LifoQueue[Streamlink] = queue.LifoQueue()
+        self.created = 0
+        self.options = self.build_options()
+        self.lock = threading.Lock()
+        self.resolved: LRUCache[Any] = LRUCache(128, resolve_ttl)
+
+    def build_options(self) -> Options:
+        options = Options()
+        TWITCH_TURBO_OAUTH = os.environ.get("TWITCH_TURBO_OAUTH")
+        options.set("api-header", [("Authorization", f"OAuth {TWITCH_TURBO_OAUTH}")])
+        options.set("low-latency", True)
+        return options
+
+    @contextmanager
+    def session(self) -> Iterator[Streamlink]:
+        try:
+            session = self.sessions.get_nowait()
+        except queue.Empty:
+            session = Streamlink()
+            with self.lock:
+                self.created += 1
+            log.debug(f"Created streamlink session ({self.created} total).")
+        try:
+            yield session
+        finally:
+            if self.sessions.qsize() < self.size:
+                self.sessions.put(session)
+
+    def streams(self, username: str) -> dict[str, Any]:
+        with self.session() as session:
+            return session.streams(f"https://twitch.tv/{username}", self.options)
+
+    def cached(self, username: str) -> Any:
+        with self.lock:
+            return self.resolved.get(username.lower())
+
+    def remember(self, username: str, stream: Any):
+        with self.lock:
+            self.resolved.put(username.lower(), stream)
+
+    def forget(self, username: str):
+        with self.lock:
+            self.resolved.discard(username.lower())
+
+    def stats(self) -> dict[str, Any]:
+        with self.lock:
+            stats = self.resolved.stats()
+        stats["sessions"] = self.created
+        return stats
@@ -5,7 +5,7 @@ import logging
 from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
-    pass
+    from .resolver import UserIdResolver
 
 log = logging.getLogger(__name__)
 
@@ -50,10 +50,13 @@ class Stream:
         log.debug(f"Parsed stream url (service = {service}, username = {username}).")
         return (url, service, username)
 
-    async def validate(self) -> bool:
+    async def validate(self, resolver: None | UserIdResolver = None) -> bool:
         if not self.service == "twitch.tv":
             return False
-        self.userid = await get_userid_from_username(self.username)
+        if resolver:
+            self.userid = await resolver.resolve(self.username)
+        else:
+            self.userid = await get_userid_from_username(self.username)
         if self.userid:
             self.valid = True
             log.debug(f"{self.url} validated: {self.valid}")
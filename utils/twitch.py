@@ -3,76 +3,356 @@ import httpx
 import os
 import logging
 import json
-from typing import Optional
-from dotenv import load_dotenv
+import time
+import trio
+from typing import Any, Optional, Sequence
 
 log = logging.getLogger(__name__)
 
+HELIX_URL = "https://api.twitch.tv/helix"
+TOKEN_URL = "https://id.twitch.tv/oauth2/token"
+TOKEN_PATH = "./appdata/twitch_token.json"
+PREVIEW_URL = "https://static-cdn.jtvnw.net/previews-ttv/live_user_{login}-{{width}}x{{height}}.jpg"
+HELIX_BATCH_SIZE = 100  # most logins helix accepts in one request
+THUMBNAIL_TIMEOUT = 3  # seconds, the capture is the fallback if this runs out
 
-def get_twitch_bearer_token() -> Optional[str]:
-    load_dotenv("./appdata/.env", override=True)
-    TWITCH_CLIENT_ID = os.environ.get("TWITCH_CLIENT_ID")
-    TWITCH_CLIENT_SECRET = os.environ.get("TWITCH_CLIENT_SECRET")
-    get_token_url = f"https://id.twitch.tv/oauth2/token?client_id={TWITCH_CLIENT_ID}&client_secret={TWITCH_CLIENT_SECRET}&grant_type=client_credentials"
-    try:
-        log.info("Sending twitch oauth token request.")
-        response = httpx.post(get_token_url)
-        log.debug(json.dumps(response.json(), indent=4))
-        oauth_token = response.json()["access_token"]
-        log.info(f"Got oauth token: {oauth_token}")
-    except:
-        log.info("Couldn't get oauth token!")
-        oauth_token = None
-    return oauth_token
+
+class TwitchError(Exception):
+    pass
+
+
+class LiveStream:
+    # the parts of a helix /streams entry the bot uses
+
+    def __init__(self, data: dict[str, Any]):
+        self.user_id: str = data.get("user_id", "")
+        self.user_login: str = data.get("user_login", "")
+        self.user_name: str = data.get("user_name", "")
+        self.game_name: str = data.get("game_name", "")
+        self.title: str = data.get("title", "")
+        self.viewer_count: int = data.get("viewer_count", 0)
+        self.started_at: str = data.get("started_at", "")
+        self.thumbnail_url: str = data.get("thumbnail_url", "")
+
+    def __repr__(self):
+        return f"LiveStream('{self.user_login}', '{self.game_name}')"
+
+    @classmethod
+    def from_login(cls, user_id: str, login: str) -> LiveStream:
+        # for when helix doesn't list a stream yet, e.g. right after it starts
+        return cls(
+            {
+                "user_id": user_id,
+                "user_login": login,
+                "user_name": login,
+                "thumbnail_url": PREVIEW_URL.format(login=login),
+            }
+        )
+
+    def thumbnail(self, width: int, height: int) -> str:
+        # twitch renders the preview at whatever size the url asks for
+        return self.thumbnail_url.replace("{width}", str(width)).replace(
+            "{height}", str(height)
+        )
+
+
+class RateLimit:
+    # helix token bucket as of the last response: limit points, refilled
+    # over a minute, remaining points, and when the bucket is full again
+
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset: float = 0.0  # unix time
+        self.throttled = 0  # 429 responses seen
+
+    def update(self, response: httpx.Response):
+        headers = response.headers
+        try:
+            self.limit = int(headers["Ratelimit-Limit"])
+            self.remaining = int(headers["Ratelimit-Remaining"])
+            self.reset = float(headers["Ratelimit-Reset"])
+        except (KeyError, ValueError):
+            pass
+        if response.status_code == 429:
+            self.throttled += 1
+            self.remaining = 0
+
+    def reset_in(self) -> float:
+        return max(self.reset - time.time(), 0.0)
+
+
+class TokenManager:
+    # app access token with its expiry, kept on disk so a restart doesn't
+    # need a new one; refreshed ahead of expiry or when helix rejects it, and
+    # concurrent refreshes wait for the first one instead of each asking
+
+    REFRESH_MARGIN = 3600  # seconds before expiry a token is replaced
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: Optional[str] = None,
+        path: Optional[str] = TOKEN_PATH,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret or os.environ.get("TWITCH_CLIENT_SECRET", "")
+        self.path = path
+        self.token = ""
+        self.expires_at = 0.0  # unix time
+        self.lock = trio.Lock()
+        self.refreshes = 0
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+            if saved["client_id"] == self.client_id:
+                self.token = saved["access_token"]
+                self.expires_at = float(saved["expires_at"])
+                log.info("Loaded saved twitch token.")
+        except (OSError, ValueError, KeyError) as e:
+            log.warning(f"Couldn't load saved twitch token! {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        saved = {
+            "client_id": self.client_id,
+            "access_token": self.token,
+            "expires_at": self.expires_at,
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as file:
+                json.dump(saved, file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning(f"Couldn't save twitch token! {e}")
+
+    def fresh(self) -> bool:
+        return bool(self.token) and time.time() < self.expires_at - self.REFRESH_MARGIN
+
+    async def get(self, client: TwitchClient) -> str:
+        if not self.fresh():
+            await self.refresh(client, self.token)
+        return self.token
+
+    async def refresh(self, client: TwitchClient, stale: str):
+        # stale is the token the caller saw fail or expire, if another task
+        # already replaced it there's nothing left to do
+        async with self.lock:
+            if self.token != stale and self.fresh():
+                return
+            log.info("Sending twitch oauth token request.")
+            response = await client.request(
+                "POST",
+                TOKEN_URL,
+                data={
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret,
+                    "grant_type": "client_credentials",
+                },
+            )
+            try:
+                response.raise_for_status()
+                data = response.json()
+                self.token = data["access_token"]
+                self.expires_at = time.time() + float(data["expires_in"])
+            except (httpx.HTTPStatusError, ValueError, KeyError) as e:
+                raise TwitchError(f"couldn't get oauth token: {e}") from e
+            self.refreshes += 1
+            log.info(f"Got twitch oauth token, expires in {data['expires_in']}s.")
+            self.save()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "refreshes": self.refreshes,
+            "expires_in": max(self.expires_at - time.time(), 0.0),
+        }
+
+
+class TwitchClient:
+    # helix api client, one connection pool and one set of credentials for
+    # the whole bot; transient failures are retried with backoff
+
+    TIMEOUT = httpx.Timeout(5, connect=3)
+    LIMITS = httpx.Limits(max_connections=10, max_keepalive_connections=5)
+    RETRIES = 2
+    RETRY_DELAY = 0.5  # seconds, doubled after each retry
+
+    def __init__(
+        self, client_id: Optional[str] = None, tokens: Optional[TokenManager] = None
+    ):
+        self.client_id = client_id or os.environ.get("TWITCH_CLIENT_ID", "")
+        self.tokens = tokens or TokenManager(self.client_id)
+        self.http = httpx.AsyncClient(timeout=self.TIMEOUT, limits=self.LIMITS)
+        self.rate_limit = RateLimit()
+
+    def headers(self, token: str) -> dict[str, str]:
+        return {
+            "Authorization": f"Bearer {token}",
+            "Client-Id": self.client_id,
+        }
+
+    async def request(
+        self, method: str, url: str, retries: int = RETRIES, **kwargs
+    ) -> httpx.Response:
+        delay = self.RETRY_DELAY
+        for attempt in range(retries + 1):
+            try:
+                response = await self.http.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                if attempt == retries:
+                    raise TwitchError(f"{method} {url} failed: {e}") from e
+                log.info(f"{method} {url} failed, retrying. {e}")
+            else:
+                if response.status_code < 500 or attempt == retries:
+                    return response
+                log.info(f"{method} {url} returned {response.status_code}, retrying.")
+            await trio.sleep(delay)
+            delay *= 2
+        raise AssertionError("unreachable")
+
+    async def helix(
+        self, path: str, params: list[tuple[str, str]]
+    ) -> list[dict[str, Any]]:
+        # data of a helix get request, raises a TwitchError on failure
+        token = await self.tokens.get(self)
+        response = await self.request(
+            "GET", f"{HELIX_URL}{path}", params=params, headers=self.headers(token)
+        )
+        if response.status_code == 401:
+            log.info("Twitch token was rejected, getting a new one.")
+            await self.tokens.refresh(self, token)
+            response = await self.request(
+                "GET",
+                f"{HELIX_URL}{path}",
+                params=params,
+                headers=self.headers(self.tokens.token),
+            )
+        log.debug(json.dumps(dict(response.headers), indent=4))
+        self.rate_limit.update(response)
+        if response.status_code != 200:
+            raise TwitchError(f"{path} returned {response.status_code}")
+        try:
+            return response.json()["data"]
+        except (ValueError, KeyError) as e:
+            raise TwitchError(f"{path} returned a bad response") from e
+
+    async def get_users(
+        self, logins: Sequence[str] = (), user_ids: Sequence[str] = ()
+    ) -> list[dict[str, Any]]:
+        data: list[dict[str, Any]] = []
+        for key, values in (("login", logins), ("id", user_ids)):
+            for i in range(0, len(values), HELIX_BATCH_SIZE):
+                chunk = values[i : i + HELIX_BATCH_SIZE]
+                data += await self.helix("/users", [(key, value) for value in chunk])
+        return data
+
+    async def get_user_id(self, login: str) -> Optional[str]:
+        users = await self.get_users([login])
+        return users[0]["id"] if users else None
+
+    async def get_streams(
+        self, logins: Sequence[str] = (), user_ids: Sequence[str] = ()
+    ) -> list[LiveStream]:
+        # live streams for any of logins or user_ids, bigger lists are split
+        # into chunks helix accepts and requested concurrently
+        results: list[list[dict[str, Any]]] = []
+        errors: list[TwitchError] = []
+
+        async def fetch(key: str, chunk: Sequence[str]):
+            params = [(key, value) for value in chunk]
+            params += [("type", "live"), ("first", str(HELIX_BATCH_SIZE))]
+            try:
+                results.append(await self.helix("/streams", params))
+            except TwitchError as e:
+                errors.append(e)
+
+        async with trio.open_nursery() as nursery:
+            for key, values in (("user_login", logins), ("user_id", user_ids)):
+                for i in range(0, len(values), HELIX_BATCH_SIZE):
+                    nursery.start_soon(fetch, key, values[i : i + HELIX_BATCH_SIZE])
+        if errors:
+            raise errors[0]
+        return [LiveStream(entry) for data in results for entry in data]
+
+    async def get_thumbnail(
+        self, stream: LiveStream, size: tuple[int, int]
+    ) -> Optional[bytes]:
+        # twitch's own preview image, None if it isn't available yet; missing
+        # previews redirect to a placeholder, so redirects count as missing
+        if not stream.thumbnail_url:
+            return None
+        url = stream.thumbnail(*size)
+        # started_at keeps the cdn from serving a preview of an earlier broadcast
+        try:
+            response = await self.request(
+                "GET",
+                url,
+                retries=0,
+                params={"t": stream.started_at},
+                timeout=THUMBNAIL_TIMEOUT,
+            )
+        except TwitchError as e:
+            log.info(f"Couldn't get twitch thumbnail for {stream.user_login}! {e}")
+            return None
+        if response.status_code != 200:
+            log.debug(f"No twitch thumbnail for {stream.user_login} yet.")
+            return None
+        return response.content
+
+
+_twitch_client: Optional[TwitchClient] = None
+
+
+def get_twitch_client() -> TwitchClient:
+    # credentials are read from the environment when it's first used, the
+    # token itself is fetched by the first request that needs it
+    global _twitch_client
+    if _twitch_client is None:
+        _twitch_client = TwitchClient()
+    return _twitch_client
 
 
 async def get_userid_from_username(username: str) -> str:
-    load_dotenv("./appdata/.env", override=True)
-    TWITCH_CLIENT_ID = os.environ.get("TWITCH_CLIENT_ID")
-    TWITCH_TOKEN = os.environ.get("TWITCH_TOKEN")
-    headers = {
-        "Authorization": f"Bearer {TWITCH_TOKEN}",
-        "Client-Id": f"{TWITCH_CLIENT_ID}",
-    }
-    url = f"https://api.twitch.tv/helix/users?login={username}"
     try:
-        response = httpx.get(url, headers=headers)
-        log.debug(json.dumps(response.json(), indent=4))
-        userid = response.json()["data"][0]["id"]
-        log.info(f"Got userid {userid}")
-    except:
-        userid = ""
+        userid = await get_twitch_client().get_user_id(username)
+    except TwitchError as e:
+        log.info(f"Couldn't get userid for {username}! {e}")
+        return ""
+    if not userid:
         log.info(f"Couldn't get userid for {username}.")
+        return ""
+    log.info(f"Got userid {userid}")
     return userid
 
 
-async def get_live_streams_by_usernames(
-    usernames: list[str],
-) -> tuple[list[Optional[str]], bool]:
-    live = []
-    if not usernames:
+async def get_live_streams(
+    user_ids: Sequence[str], usernames: Sequence[str] = ()
+) -> tuple[list[LiveStream], bool]:
+    # streams are polled by user id, which survives renames; usernames are
+    # for streams whose id isn't known
+    if not user_ids and not usernames:
         log.info(f"Couldn't get streams.")
-        return live, False
-    load_dotenv("./appdata/.env", override=True)
-    TWITCH_CLIENT_ID = os.environ.get("TWITCH_CLIENT_ID")
-    TWITCH_TOKEN = os.environ.get("TWITCH_TOKEN")
-    headers = {
-        "Authorization": f"Bearer {TWITCH_TOKEN}",
-        "Client-Id": f"{TWITCH_CLIENT_ID}",
-    }
-    url = f"https://api.twitch.tv/helix/streams?"
-    for username in usernames:
-        url += f"user_login={username}&"
-    url += "type=live&first=100"
+        return [], False
     try:
         logging.getLogger("httpx").setLevel(logging.WARNING)
-        response = httpx.get(url, headers=headers)
+        return await get_twitch_client().get_streams(usernames, user_ids), True
+    except TwitchError as e:
+        # a missing chunk would look like its streams all went offline
+        log.info(f"Couldn't get streams! {e}")
+        return [], False
+    finally:
         logging.getLogger("httpx").setLevel(logging.DEBUG)
-        log.debug(json.dumps(response.json(), indent=4))
-        log.debug(json.dumps(dict(response.headers), indent=4))
-        for stream in response.json()["data"]:
-            live.append(stream["user_login"])
-        return live, True
-    except:
-        log.info(f"Couldn't get streams.")
-        return live, False
+
+
+async def get_twitch_thumbnail(
+    stream: LiveStream, size: tuple[int, int]
+) -> Optional[bytes]:
+    return await get_twitch_client().get_thumbnail(stream, size)
@@ -1,9 +1,13 @@
+import io
 import random
-import json
 from PIL import Image, ImageDraw, ImageFont
-from colormath.color_conversions import convert_color
-from colormath.color_diff import delta_e_cie1976, delta_e_cie2000
-from colormath.color_objects import LabColor, sRGBColor
+from colormath.color_objects import sRGBColor
+
+from .cache import LRUCache
+from .palette import get_palette
+
+swatch_cache: LRUCache[bytes] = LRUCache(256)
+color_name_cache: LRUCache[str] = LRUCache(4096)  # keyed by 0xRRGGBB
 
 
 def get_adjective() -> str:
@@ -44,21 +48,40 @@ def get_adjective() -> str:
 
 
 def get_color_name(srgb_color: sRGBColor) -> str:
-    lab_color = convert_color(srgb_color, LabColor)
-    lowest = (999, {})
-    with open("colornames.json", encoding="utf-8") as colornames:
-        colornames = json.loads(colornames.read())
-    for color in colornames:
-        srgb = sRGBColor.new_from_rgb_hex(color["hex"])
-        lab = convert_color(srgb, LabColor)
-        delta_e = delta_e_cie1976(lab_color, lab)
-        if delta_e < lowest[0]:
-            lowest = (delta_e, color)
-    return lowest[1]["name"]
+    r, g, b = (min(max(v, 0), 255) for v in srgb_color.get_upscaled_value_tuple())
+    return get_color_name_from_int((r << 16) | (g << 8) | b)
+
+
+def get_color_name_from_int(color: int) -> str:
+    name = color_name_cache.get(color)
+    if name is None:
+        name = get_palette().name_packed([color])[0]
+        color_name_cache.put(color, name)
+    return name
+
+
+def warm_color_names(colors: list[int]):
+    # names colors ahead of time, e.g. a rainbow gradient before it's shown
+    missing = list(dict.fromkeys(c for c in colors if c not in color_name_cache))
+    for color, name in zip(missing, get_palette().name_packed(missing)):
+        color_name_cache.put(color, name)
+
+
+def get_color_names(srgb_colors: list[sRGBColor]) -> list[str]:
+    return get_palette().name_srgb_many(srgb_colors)
 
 
-def generate_color_swatch(color: sRGBColor):
-    img = Image.new("RGB", (175, 175), color=color.get_rgb_hex())
+def generate_color_swatch(color: sRGBColor) -> bytes:
+    # png bytes, cached by hex since random picks and popular names repeat
+    hex = color.get_rgb_hex()
+    swatch = swatch_cache.get(hex)
+    if swatch is not None:
+        return swatch
+    img = Image.new("RGB", (175, 175), color=hex)
     d = ImageDraw.Draw(img)
-    d.text((130, 163), color.get_rgb_hex(), fill="black")
-    img.save("./appdata/color.png")
+    d.text((130, 163), hex, fill="black")
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    swatch = buffer.getvalue()
+    swatch_cache.put(hex, swatch)
+    return swatch